@@ -0,0 +1,166 @@
+"""
+analysis_pool.py
+----------------
+Executor for CPU-bound leaf analysis, kept off the FastAPI event loop.
+
+Image decode and colour analysis run in a process pool (or a thread pool
+with ANALYSIS_EXECUTOR=thread). At most ANALYSIS_WORKERS jobs run and
+ANALYSIS_MAX_QUEUE more may wait; beyond that submit() raises PoolSaturated
+straight away so the endpoint can answer 503 instead of piling up uploads.
+Each job gets ANALYSIS_TIMEOUT seconds before the caller gives up on it.
+
+Worker processes are started with ANALYSIS_START_METHOD (forkserver where
+available, else spawn) rather than forked from the API process and its
+writer/reloader threads. If a worker dies, e.g. OOM-killed in a large
+decode, the broken executor is replaced and the affected callers get
+PoolBroken (503) instead of every later request failing.
+Stage timings taken inside a job are sent back with its result and merged
+into this process's metrics.
+
+Jobs can be named as "module:function" strings. The module is then
+imported by whoever runs the job, so with a process pool the API process
+never loads the analysis code (NumPy, PIL) at all.
+"""
+
+import asyncio
+import importlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+ANALYSIS_EXECUTOR = os.environ.get("ANALYSIS_EXECUTOR", "process")
+# Small fixed default: os.cpu_count() reports the host, not the container's share
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", 2))
+ANALYSIS_MAX_QUEUE = int(os.environ.get("ANALYSIS_MAX_QUEUE", 16))
+ANALYSIS_TIMEOUT = float(os.environ.get("ANALYSIS_TIMEOUT", 30))
+ANALYSIS_START_METHOD = os.environ.get(
+    "ANALYSIS_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn",
+)
+
+
+def resolve(target):
+    """A callable, or "package.module:function" imported on first use."""
+    if callable(target):
+        return target
+    module, _, name = target.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _run_job(target, *args):
+    return metrics.call_recorded(resolve(target), *args)
+
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the wait queue is full."""
+
+
+class AnalysisTimeout(Exception):
+    """A job did not finish within its timeout."""
+
+
+class PoolBroken(Exception):
+    """A worker process died; the pool has been replaced for later jobs."""
+
+
+class AnalysisPool:
+    """
+    Bounded executor. A slot is taken per submitted job and only given back
+    when the job really finishes (or is cancelled before it starts), so a
+    timed-out job that is still running keeps counting against the limit.
+    """
+
+    def __init__(self, kind=ANALYSIS_EXECUTOR, workers=ANALYSIS_WORKERS,
+                 max_queue=ANALYSIS_MAX_QUEUE, timeout=ANALYSIS_TIMEOUT):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown ANALYSIS_EXECUTOR: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.executor = self._new_executor()
+        self.capacity = workers + max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+
+    def _new_executor(self):
+        if self.kind == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="leaf-analysis")
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   mp_context=multiprocessing.get_context(ANALYSIS_START_METHOD))
+
+    def _replace(self, broken):
+        """Swap in a fresh executor, once per broken one."""
+        if self.executor is broken:
+            print("Analysis worker died; restarting the process pool")
+            metrics.count("analysis_pool_broken")
+            self.executor = self._new_executor()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, _future):
+        self.in_flight -= 1
+
+    async def submit(self, fn, *args, timeout=None):
+        """Run fn(*args) in the pool and await its result."""
+        if self.in_flight >= self.capacity:
+            metrics.count("analysis_saturated")
+            raise PoolSaturated(f"{self.in_flight} analysis jobs in flight")
+
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            job = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._replace(executor)
+            raise PoolBroken("analysis pool was broken and has been restarted")
+        self.in_flight += 1
+        job.add_done_callback(lambda f: loop.call_soon_threadsafe(self._release, f))
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)),
+                                          timeout or self.timeout)
+        except BrokenProcessPool:
+            self._replace(executor)
+            raise PoolBroken("an analysis worker died")
+        except asyncio.TimeoutError:
+            # Drops the job if it is still queued; a running one finishes on its own
+            job.cancel()
+            metrics.count("analysis_timeout")
+            raise AnalysisTimeout(f"analysis exceeded {timeout or self.timeout:g}s")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool = None
+
+
+def start_pool():
+    global _pool
+    if _pool is None:
+        _pool = AnalysisPool()
+    return _pool
+
+
+def shutdown_pool():
+    """Let running jobs finish, drop queued ones (called on app shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+async def run_analysis(target, *args, timeout=None):
+    """Run target(*args) in the pool; target is a callable or a "module:function" name."""
+    result, observations = await start_pool().submit(_run_job, target, *args, timeout=timeout)
+    metrics.merge(observations)
+    return result
+
+
+metrics.register_callback(
+    "agrisaarthi_analysis_in_flight", "Analysis jobs running or waiting in the pool.",
+    lambda: _pool.in_flight if _pool is not None else None)
+metrics.register_callback(
+    "agrisaarthi_analysis_capacity", "Workers plus wait-queue slots of the analysis pool.",
+    lambda: _pool.capacity if _pool is not None else None)
@@ -0,0 +1,156 @@
+"""
+bench_api.py
+------------
+Load test for the API endpoints: p50/p95/p99 latency and throughput for
+/api/recommend_crop, /api/detect_disease (synthetic leaves at several
+resolutions plus the bundled JPEGs) and /api/history, optionally against a
+seeded history table of --history-rows rows.
+
+By default the app runs in-process through FastAPI's TestClient with its
+own temporary database. With --url it drives a running uvicorn instead; pass
+--db pointing at that server's farmer_history.db to seed its history.
+
+Usage (from backend/):
+    python benchmarks/bench_api.py --requests 200 --out bench_api.json
+    python benchmarks/bench_api.py --history-rows 1000000 --out bench_1m.json
+    python benchmarks/bench_api.py --url http://127.0.0.1:8000 --concurrency 8
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from common import (  # also puts backend/ on sys.path
+    BUNDLED_LEAVES, LEAF_RESOLUTIONS, print_table, seed_history, summarize,
+    synthetic_leaf, unique_upload, write_results,
+)
+
+ZONES = ["Tropical", "Temperate", "Mediterranean", "Dry"]
+WATER = ["Low", "Medium", "High"]
+STATES = ["Kerala", "Punjab", "Maharashtra", "Uttar Pradesh", "Goa"]
+LANGS = ["en", "hi", "ta", "te", "ml"]
+
+
+def run_load(client, make_request, n, concurrency):
+    """Issue n requests from `concurrency` threads; returns a summarize() dict."""
+    def one(i):
+        method, url, kwargs = make_request(i)
+        t = time.perf_counter()
+        resp = client.request(method, url, **kwargs)
+        return time.perf_counter() - t, resp.status_code >= 400
+
+    for i in range(min(3, n)):  # warmup
+        one(i)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(n)))
+    wall = time.perf_counter() - start
+    return summarize([t for t, _ in outcomes], wall, errors=sum(err for _, err in outcomes))
+
+
+def recommend_requests(seed=42):
+    rng = random.Random(seed)
+
+    def make(i):
+        return "POST", "/api/recommend_crop", {"json": {
+            "state": rng.choice(STATES),
+            "climate_zone": rng.choice(ZONES),
+            "soil_ph": round(rng.uniform(4.5, 9.0), 1),
+            "water": rng.choice(WATER),
+            "lang": rng.choice(LANGS),
+        }}
+    return make
+
+
+def detect_requests(jpeg, unique):
+    def make(i):
+        body = unique_upload(jpeg, i) if unique else jpeg
+        return "POST", "/api/detect_disease", {
+            "data": {"farmer_name": "bench", "lang": LANGS[i % len(LANGS)]},
+            "files": {"file": ("leaf.jpg", body, "image/jpeg")},
+        }
+    return make
+
+
+def history_requests(filtered):
+    def make(i):
+        params = {"limit": 50, "lang": LANGS[i % len(LANGS)]}
+        if filtered:
+            params["farmer_name"] = f"farmer-{i % 2000}"
+        return "GET", "/api/history", {"params": params}
+    return make
+
+
+def leaves():
+    cases = {name: synthetic_leaf(size, seed=i) for i, (name, size) in enumerate(LEAF_RESOLUTIONS.items())}
+    for name, path in BUNDLED_LEAVES.items():
+        if path.exists():
+            # sample_leaf.jpg is an empty placeholder, which exercises the fallback path
+            cases[name] = path.read_bytes()
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--db", help="history database to seed (default: a temporary file in-process)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint case")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--history-rows", type=int, default=0, help="seed the history table to this many rows")
+    parser.add_argument("--skip", action="append", default=[], choices=["recommend", "detect", "history"])
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+    if args.history_rows and args.url and not args.db:
+        parser.error("--history-rows with --url needs --db pointing at that server's history database")
+
+    db_path = args.db
+    if db_path is None and args.url is None:
+        db_path = str(Path(tempfile.mkdtemp(prefix="agrisaarthi-bench-")) / "history.db")
+    if args.history_rows and db_path:
+        t = time.perf_counter()
+        rows = seed_history(db_path, args.history_rows)
+        print(f"history table: {rows} rows ({time.perf_counter() - t:.1f}s to seed)")
+
+    if args.url:
+        import httpx
+        client = httpx.Client(base_url=args.url, timeout=60)
+        close = client.close
+    else:
+        import db_handler
+        db_handler.DB_PATH = db_path
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)
+        client.__enter__()  # run the lifespan: writer thread, analysis pool, datasets
+        close = lambda: client.__exit__(None, None, None)  # noqa: E731
+
+    n, conc = args.requests, args.concurrency
+    results = {}
+    try:
+        if "recommend" not in args.skip:
+            results["recommend_crop"] = run_load(client, recommend_requests(), n, conc)
+
+        if "detect" not in args.skip:
+            for name, jpeg in leaves().items():
+                label = f"detect_disease[{name}, {len(jpeg) // 1024} KiB]"
+                results[label] = run_load(client, detect_requests(jpeg, unique=True), n, conc)
+            cached = synthetic_leaf(LEAF_RESOLUTIONS["1920x1080"], seed=99)
+            results["detect_disease[1920x1080, repeat upload]"] = run_load(
+                client, detect_requests(cached, unique=False), n, conc)
+
+        if "history" not in args.skip:
+            results["history[page]"] = run_load(client, history_requests(filtered=False), n, conc)
+            results["history[farmer filter]"] = run_load(client, history_requests(filtered=True), n, conc)
+    finally:
+        close()
+
+    print_table(results)
+    if args.out:
+        write_results(args.out, "api", results, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+bench_micro.py
+--------------
+Micro-benchmarks for the hot functions behind the API, without HTTP:
+predict_disease / classify_leaves per leaf resolution, dataset loading
+(the old load_crop_data, now datasets.build_snapshot) with a cold and a warm
+market-price cache, and save_disease_history through the background writer.
+
+Usage (from backend/):
+    python benchmarks/bench_micro.py --n 50 --out bench_micro.json
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from common import (  # also puts backend/ on sys.path
+    LEAF_RESOLUTIONS, print_table, summarize, synthetic_leaf, time_calls, write_results,
+)
+
+
+def bench_detector(n, results):
+    from ml.disease_detector import classify_leaves, predict_disease
+
+    for i, (name, size) in enumerate(LEAF_RESOLUTIONS.items()):
+        jpeg = synthetic_leaf(size, seed=i)
+        results[f"predict_disease[{name}]"] = time_calls(lambda: predict_disease(jpeg), n)
+
+    batch = [synthetic_leaf(LEAF_RESOLUTIONS["1920x1080"], seed=s) for s in range(16)]
+    per_batch = time_calls(lambda: classify_leaves(batch), max(1, n // 5))
+    results["classify_leaves[16 x 1920x1080]"] = per_batch
+
+
+def bench_datasets(n, results):
+    from datasets import DATA_FILES, build_snapshot
+    from market_prices import cache_path_for
+
+    # Work on copies: the live .npz next to the real feed belongs to any server on this host
+    tmp = Path(tempfile.mkdtemp(prefix="agrisaarthi-bench-"))
+    paths = {name: Path(shutil.copy(path, tmp / Path(path).name)) for name, path in DATA_FILES.items()}
+    cache = cache_path_for(paths["prices"])
+
+    def cold():
+        cache.unlink(missing_ok=True)
+        build_snapshot(paths, 1, {})
+
+    try:
+        results["load_crop_data[cold price cache]"] = time_calls(cold, max(1, n // 5), warmup=1)
+        results["load_crop_data[warm price cache]"] = time_calls(lambda: build_snapshot(paths, 1, {}), max(1, n // 5))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_history_writes(n, results):
+    import db_handler
+
+    db_handler.DB_PATH = str(Path(tempfile.mkdtemp(prefix="agrisaarthi-bench-")) / "history.db")
+    db_handler.init_db()
+    db_handler.start_writer()
+    try:
+        row = ("bench", "Wheat", "Leaf Rust", "Leaf_Rust", "en")
+        rows = n * 20
+        results["save_disease_history[enqueue]"] = time_calls(
+            lambda: db_handler.save_disease_history(*row), rows)
+
+        # End to end: enqueue a burst and wait until the writer has committed it
+        latencies = []
+        for _ in range(n):
+            t = time.perf_counter()
+            for _ in range(64):
+                db_handler.save_disease_history(*row)
+            db_handler.flush_history()
+            latencies.append(time.perf_counter() - t)
+        results["save_disease_history[64 rows committed]"] = summarize(latencies)
+    finally:
+        db_handler.shutdown_writer()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=50, help="iterations per benchmark")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    results = {}
+    bench_detector(args.n, results)
+    bench_datasets(args.n, results)
+    bench_history_writes(args.n, results)
+
+    print_table(results)
+    if args.out:
+        write_results(args.out, "micro", results, args)
+
+
+if __name__ == "__main__":
+    main()
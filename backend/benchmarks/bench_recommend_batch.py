@@ -0,0 +1,69 @@
+"""
+bench_recommend_batch.py
+------------------------
+Compares POST /api/recommend_crop/batch against N single /api/recommend_crop
+calls, in-process through FastAPI's TestClient.
+
+Usage (from backend/):
+    python benchmarks/bench_recommend_batch.py --n 2000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from main import app  # noqa: E402
+
+ZONES = ["Tropical", "Temperate", "Mediterranean", "Dry"]
+WATER = ["Low", "Medium", "High"]
+LANGS = ["en", "hi", "ta", "te", "ml"]
+
+
+def make_requests(n, seed=42):
+    rng = random.Random(seed)
+    return [
+        {
+            "state": "Kerala",
+            "climate_zone": rng.choice(ZONES),
+            "soil_ph": round(rng.uniform(4.5, 9.0), 1),
+            "water": rng.choice(WATER),
+            "lang": rng.choice(LANGS),
+        }
+        for _ in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=1000, help="number of field requests")
+    args = parser.parse_args()
+
+    client = TestClient(app)
+    reqs = make_requests(args.n)
+
+    start = time.perf_counter()
+    for req in reqs:
+        client.post("/api/recommend_crop", json=req)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    resp = client.post("/api/recommend_crop/batch", json=reqs)
+    lines = resp.text.splitlines()
+    batch = time.perf_counter() - start
+
+    assert len(lines) == args.n, f"expected {args.n} NDJSON lines, got {len(lines)}"
+
+    print(f"requests:        {args.n}")
+    print(f"{args.n} single calls: {single:8.3f}s  ({args.n / single:9.0f} req/s)")
+    print(f"1 batch call:    {batch:8.3f}s  ({args.n / batch:9.0f} req/s)")
+    print(f"speedup:         {single / batch:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+bench_startup.py
+----------------
+Cold-start cost of the API process: time to import main, time until the
+lifespan has finished (the server would accept requests), the first request
+to each endpoint family, and memory after every step: the API process's
+RSS, and the total RSS of it plus every process it started (forkserver,
+resource tracker, analysis workers), which is what the host has to hold.
+Every run is a fresh interpreter, once with the default startup and once
+with LEAN_STARTUP=1. Each request's HTTP status is recorded rather than
+checked, so a revision whose endpoint fails is still measured.
+
+--baseline-ref measures the same steps on another git revision (exported
+with git archive), so the improvement shows up side by side; save both
+with --out and feed them to compare.py.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py --runs 5 --out bench_startup.json
+    python benchmarks/bench_startup.py --baseline-ref HEAD~1
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+HEAVY_MODULES = ("pandas", "numpy", "PIL")
+STEPS = ("import main", "startup", "first history", "first detect_disease", "first recommend_crop")
+
+
+def rss_mb(pid="self"):
+    """Current resident set size of a process in MiB."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid != "self":
+        return 0.0
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # peak, not current
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def descendants(pid):
+    """PIDs of every process below pid, from /proc (empty where there is no /proc)."""
+    children = {}
+    for entry in Path("/proc").glob("[0-9]*"):
+        try:
+            # The command name in field 2 may contain spaces; ppid follows it
+            ppid = int(entry.joinpath("stat").read_text().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry.name))
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), ()):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def total_rss_mb():
+    """RSS of this process plus all of its descendants in MiB."""
+    return rss_mb() + sum(rss_mb(child) for child in descendants(os.getpid()))
+
+
+def probe():
+    """Runs in a fresh interpreter with cwd = the backend/ being measured."""
+    sys.path.insert(0, os.getcwd())
+    out = {}
+
+    def record(step, start, resp=None):
+        out[step] = {
+            "seconds": time.perf_counter() - start,
+            "status": None if resp is None else resp.status_code,
+            "rss_mb": round(rss_mb(), 1),
+            "total_rss_mb": round(total_rss_mb(), 1),
+            "heavy": [m for m in HEAVY_MODULES if m in sys.modules],
+        }
+
+    t = time.perf_counter()
+    import main
+    record("import main", t)
+
+    import db_handler
+    db_handler.DB_PATH = str(Path(tempfile.mkdtemp(prefix="agrisaarthi-bench-")) / "history.db")
+    from fastapi.testclient import TestClient
+    # A failing endpoint is recorded as its status, not raised
+    client = TestClient(main.app, raise_server_exceptions=False)
+    t = time.perf_counter()
+    client.__enter__()
+    record("startup", t)
+
+    try:
+        t = time.perf_counter()
+        resp = client.get("/api/history", params={"limit": 50})
+        record("first history", t, resp)
+
+        leaf = Path("data/uploaded_leaf.jpg").read_bytes()
+        t = time.perf_counter()
+        resp = client.post("/api/detect_disease", data={"farmer_name": "bench"},
+                           files={"file": ("leaf.jpg", leaf, "image/jpeg")})
+        record("first detect_disease", t, resp)
+
+        t = time.perf_counter()
+        resp = client.post("/api/recommend_crop", json={
+            "state": "Kerala", "climate_zone": "Tropical", "soil_ph": 6.5, "water": "High",
+        })
+        record("first recommend_crop", t, resp)
+    finally:
+        client.__exit__(None, None, None)
+    print(json.dumps(out))
+
+
+def run_probe(backend_dir, lean):
+    env = dict(os.environ, LEAN_STARTUP="1" if lean else "0")
+    proc = subprocess.run([sys.executable, str(Path(__file__).resolve()), "--probe"],
+                          cwd=backend_dir, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"probe failed in {backend_dir}:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def export_revision(ref, backend_dir):
+    """Extract backend/ at a git revision into a temp dir; returns its backend path."""
+    dest = Path(tempfile.mkdtemp(prefix="agrisaarthi-ref-"))
+    repo = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=backend_dir,
+                          capture_output=True, text=True, check=True).stdout.strip()
+    archive = subprocess.run(["git", "archive", "--format=tar", ref, "backend"], cwd=repo,
+                             capture_output=True, check=True).stdout
+    archive_path = dest / "backend.tar"
+    archive_path.write_bytes(archive)
+    with tarfile.open(archive_path) as tar:
+        tar.extractall(dest)
+    return dest / "backend"
+
+
+def measure(label, backend_dir, lean, runs, results):
+    from common import summarize
+
+    run_probe(backend_dir, lean)  # warmup: bytecode and market-price caches
+    samples = [run_probe(backend_dir, lean) for _ in range(runs)]
+    for step in STEPS:
+        seconds = [s[step]["seconds"] for s in samples if step in s]
+        if not seconds:
+            continue
+        median = lambda key: sorted(s[step][key] for s in samples)[len(samples) // 2]  # noqa: E731
+        statuses = [s[step]["status"] for s in samples]
+        results[f"{label}: {step}"] = {
+            **summarize(seconds, errors=sum(1 for code in statuses if code is not None and code >= 400)),
+            "status": statuses[-1],
+            "rss_mb": median("rss_mb"),
+            "total_rss_mb": median("total_rss_mb"),
+            "heavy_modules": samples[-1][step]["heavy"],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per mode")
+    parser.add_argument("--baseline-ref", help="also measure this git revision (default startup only)")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    if args.probe:
+        probe()
+        return
+
+    from common import BACKEND_DIR, print_table, write_results  # also puts backend/ on sys.path
+
+    results = {}
+    if args.baseline_ref:
+        measure(args.baseline_ref, export_revision(args.baseline_ref, BACKEND_DIR), False, args.runs, results)
+    measure("default", BACKEND_DIR, False, args.runs, results)
+    measure("lean", BACKEND_DIR, True, args.runs, results)
+
+    print_table(results)
+    print(f"\n{'step':44} {'status':>6} {'RSS MiB':>8} {'total':>8}  heavy modules loaded")
+    for name, r in results.items():
+        status = "-" if r["status"] is None else r["status"]
+        print(f"{name:44} {status:>6} {r['rss_mb']:8.1f} {r['total_rss_mb']:8.1f}  "
+              f"{', '.join(r['heavy_modules']) or '-'}")
+    if args.out:
+        write_results(args.out, "startup", results, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+common.py
+---------
+Shared helpers for the benchmark scripts: latency summaries, JSON result
+files, synthetic leaf photos and a bulk history seeder.
+"""
+
+import datetime
+import io
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Phone-camera sizes the detector sees in the field, plus a small upload
+LEAF_RESOLUTIONS = {
+    "640x480": (640, 480),
+    "1920x1080": (1920, 1080),
+    "4000x3000": (4000, 3000),
+}
+BUNDLED_LEAVES = {
+    "sample_leaf.jpg": BACKEND_DIR / "data" / "sample_leaf.jpg",
+    "uploaded_leaf.jpg": BACKEND_DIR / "data" / "uploaded_leaf.jpg",
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies, wall=None, errors=0):
+    """Latencies in seconds -> ms percentiles and throughput (requests / wall seconds)."""
+    values = sorted(latencies)
+    ms = lambda v: None if v is None else round(v * 1000, 3)  # noqa: E731
+    wall = wall if wall is not None else sum(values)
+    return {
+        "n": len(values),
+        "errors": errors,
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(values[-1]) if values else None,
+        "throughput_rps": round(len(values) / wall, 2) if wall else None,
+    }
+
+
+def time_calls(fn, n, warmup=3):
+    """Call fn() n times after a warmup; returns a summarize() dict."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def print_table(results):
+    print(f"{'benchmark':44} {'n':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'req/s':>10}")
+    for name, r in results.items():
+        fmt = lambda v: "-" if v is None else f"{v:10.2f}"  # noqa: E731
+        print(f"{name:44} {r['n']:>6} {fmt(r['p50_ms'])} {fmt(r['p95_ms'])} {fmt(r['p99_ms'])} {fmt(r['throughput_rps'])}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, suite, results, args):
+    doc = {
+        "suite": suite,
+        "meta": {
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    Path(path).write_text(json.dumps(doc, indent=2, default=str))
+    print(f"results written to {path}")
+
+
+def synthetic_leaf(size, seed=0, quality=90):
+    """
+    JPEG bytes of a leaf-like image: a green gradient with brown blotches and
+    sensor noise, so it compresses like a real photo rather than a flat fill.
+    """
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    w, h = size
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    img = np.empty((h, w, 3), dtype=np.float32)
+    img[..., 0] = 60 + 40 * x / w
+    img[..., 1] = 120 + 60 * y / h
+    img[..., 2] = 40 + 20 * (x + y) / (w + h)
+    for _ in range(12):
+        cx, cy, r = rng.uniform(0, w), rng.uniform(0, h), rng.uniform(0.02, 0.08) * min(w, h)
+        spot = ((x - cx) ** 2 + (y - cy) ** 2) < r * r
+        img[spot] = (120, 80, 30)
+    img += rng.normal(0, 6, img.shape).astype(np.float32)
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def unique_upload(jpeg, counter):
+    """
+    Same pixels, different bytes: JPEG decoders ignore data after the EOI
+    marker, so this defeats the content-addressed prediction cache.
+    """
+    return jpeg + b"bench" + counter.to_bytes(8, "big")
+
+
+def seed_history(db_path, rows, batch=50_000, seed=7):
+    """Bulk-insert synthetic history rows spread over the last year."""
+    import db_handler
+    from ml.disease_db import DISEASE_KEYS, LANGS, localized
+
+    db_handler.DB_PATH = str(db_path)
+    db_handler.init_db()
+    conn = sqlite3.connect(str(db_path))
+    existing = conn.execute("SELECT COUNT(*) FROM disease_history").fetchone()[0]
+    if existing >= rows:
+        conn.close()
+        return existing
+
+    rng = random.Random(seed)
+    farmers = [f"farmer-{i}" for i in range(2000)]
+    now = datetime.datetime.now()
+    todo = rows - existing
+    while todo > 0:
+        chunk = []
+        for _ in range(min(batch, todo)):
+            key, lang = rng.choice(DISEASE_KEYS), rng.choice(LANGS)
+            ts = now - datetime.timedelta(seconds=rng.randrange(365 * 86400))
+            chunk.append((
+                rng.choice(farmers), localized(key, "crop", lang),
+                localized(key, "disease", lang).replace("_", " "),
+                key, lang, ts.strftime("%Y-%m-%d %H:%M:%S"),
+            ))
+        conn.executemany(
+            "INSERT INTO disease_history (farmer_name, crop, disease, disease_key, lang, timestamp) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            chunk,
+        )
+        conn.commit()
+        todo -= len(chunk)
+    conn.close()
+    return rows
@@ -0,0 +1,66 @@
+"""
+compare.py
+----------
+Compare two benchmark result files and flag regressions.
+
+A benchmark regresses when its p50 or p95 latency grows by more than
+--threshold (default 10%). Exits with status 1 if anything regressed, so it
+can gate a deploy.
+
+Usage (from backend/):
+    python benchmarks/compare.py baseline.json candidate.json --threshold 0.15
+"""
+
+import argparse
+import json
+import sys
+
+METRICS = ("p50_ms", "p95_ms")
+
+
+def compare(base, cand, threshold):
+    rows, regressed = [], []
+    for name, new in cand["results"].items():
+        old = base["results"].get(name)
+        if old is None:
+            rows.append((name, "new", "", ""))
+            continue
+        changes = []
+        for metric in METRICS:
+            if old.get(metric) and new.get(metric) is not None:
+                changes.append(new[metric] / old[metric] - 1)
+        worst = max(changes) if changes else 0.0
+        status = "REGRESSED" if worst > threshold else "improved" if worst < -threshold else "ok"
+        if status == "REGRESSED":
+            regressed.append(name)
+        rows.append((name, status, f"{old.get('p50_ms')} -> {new.get('p50_ms')}", f"{worst:+.1%}"))
+    for name in base["results"]:
+        if name not in cand["results"]:
+            rows.append((name, "missing", "", ""))
+    return rows, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        base = json.load(f)
+    with open(args.candidate) as f:
+        cand = json.load(f)
+
+    rows, regressed = compare(base, cand, args.threshold)
+    print(f"{'benchmark':44} {'status':10} {'p50 ms':>24} {'worst':>8}")
+    for name, status, p50, worst in rows:
+        print(f"{name:44} {status:10} {p50:>24} {worst:>8}")
+
+    if regressed:
+        print(f"\n{len(regressed)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
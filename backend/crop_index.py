@@ -0,0 +1,266 @@
+"""
+crop_index.py
+-------------
+Precomputed crop-suitability index for /api/recommend_crop.
+
+The crop profiles are joined with market prices, ranked by Profit_Index and
+grouped by (climate_zone, water_need, season) once, when the data is loaded.
+Within each group the soil pH axis is cut into elementary segments at every
+ph_min / ph_max breakpoint, and the top-3 localized results are stored per
+segment.  A request is then a dict lookup plus a bisect over the breakpoints.
+
+Batches of requests are evaluated in one NumPy pass over the ranked rows
+(see CropIndex.evaluate_batch) instead of looping the single lookup.
+
+The profiles come in as plain dict rows (see datasets.load_crops) and the
+index holds only dicts, tuples and NumPy arrays, so pandas is not needed to
+build or serve it.
+
+Prices come from the mandi feed (see market_prices.py): StateCropIndex keeps
+one CropIndex per state ranked by that state's prices, plus a national one
+for states the feed does not cover.
+"""
+
+import math
+from bisect import bisect_left
+
+import numpy as np
+
+from market_prices import normalize_state
+
+LANGS = ("en", "hi", "ta", "te", "ml")
+TOP_N = 3
+KEY_COLUMNS = ("climate_zone", "water_need", "season")
+BATCH_CHUNK = 4096  # requests per broadcast block, bounds the mask to chunk x rows
+
+
+def _localize(row, lang):
+    # Same fallbacks as the original per-request row.get() calls
+    crop_name = row.get(f"crop_{lang}", row["crop"]) if lang != "en" else row["crop"]
+    return {
+        "crop": crop_name,
+        "profit_index": float(row["Profit_Index"]),
+        "water_need": row["water_need"],
+        "carbon_footprint": row.get("carbon_footprint", "N/A"),
+        "sowing_months": row.get("sowing_months", "N/A"),
+        "fertilizer": row.get("fertilizer", "N/A"),
+    }
+
+
+def _rank_key(row):
+    # Profit_Index descending, missing values last; sorted() is stable for ties
+    value = row["Profit_Index"]
+    return (math.isnan(value), -value)
+
+
+class PhIntervalIndex:
+    """
+    Closed [ph_min, ph_max] intervals over profit-ranked rows.
+
+    Breakpoints b0 < b1 < ... < bk-1 split the pH axis into 2k+1 slots:
+    even slots are the open gaps (b[i-1], b[i]) and odd slots the points b[i].
+    Every slot stores the top results (per language) of the rows covering it.
+    """
+
+    def __init__(self, ph_min, ph_max, records):
+        """ph_min/ph_max arrays and {lang: localized rows}, all in ranked order."""
+        bounds = sorted(set(ph_min.tolist()).union(ph_max.tolist()))
+        self.breakpoints = [float(b) for b in bounds]
+
+        self.slots = []
+        for slot in range(2 * len(self.breakpoints) + 1):
+            probe = self._representative(slot)
+            if probe is None:
+                self.slots.append({})
+                continue
+            hits = [i for i in range(len(ph_min))
+                    if ph_min[i] <= probe <= ph_max[i]][:TOP_N]
+            self.slots.append({lang: tuple(records[lang][i] for i in hits) for lang in LANGS})
+
+    def _representative(self, slot):
+        b = self.breakpoints
+        i, is_point = divmod(slot, 2)
+        if is_point:
+            return b[i]
+        if i == 0 or i == len(b):
+            return None  # outside every interval
+        return (b[i - 1] + b[i]) / 2
+
+    def probe(self, ph, lang="en"):
+        i = bisect_left(self.breakpoints, ph)
+        if i < len(self.breakpoints) and self.breakpoints[i] == ph:
+            slot = 2 * i + 1
+        else:
+            slot = 2 * i
+        return self.slots[slot].get(lang, ())
+
+
+class RankedCrops:
+    """
+    Column arrays of the profit-ranked rows for vectorized batch evaluation.
+
+    The key columns are stored as integer category codes so a batch can be
+    matched with plain integer comparisons.
+    """
+
+    def __init__(self, ranked, lowered, records):
+        """ranked rows, {key column: lower-cased values} and localized records."""
+        self.ph_min = np.array([row["ph_min"] for row in ranked], dtype=float)
+        self.ph_max = np.array([row["ph_max"] for row in ranked], dtype=float)
+        self.categories = {}
+        self.codes = {}
+        for col in KEY_COLUMNS:
+            lookup = {v: i for i, v in enumerate(sorted(set(lowered[col])))}
+            self.categories[col] = lookup
+            self.codes[col] = np.fromiter((lookup[v] for v in lowered[col]), dtype=np.int32,
+                                          count=len(lowered[col]))
+        self.records = records
+
+    def encode(self, col, values):
+        lookup = self.categories[col]
+        return np.fromiter((lookup.get(v.lower(), -1) for v in values), dtype=np.int32, count=len(values))
+
+    def top_n(self, zone, water, season, ph):
+        """
+        Boolean (requests x rows) match matrix -> positions of the first TOP_N
+        matching rows per request, as (request_idx, row_idx) in ranked order.
+        """
+        mask = (
+            (self.ph_min[None, :] <= ph[:, None]) &
+            (self.ph_max[None, :] >= ph[:, None]) &
+            (self.codes["climate_zone"][None, :] == zone[:, None]) &
+            (self.codes["water_need"][None, :] == water[:, None]) &
+            (self.codes["season"][None, :] == season[:, None])
+        )
+        mask &= np.cumsum(mask, axis=1) <= TOP_N
+        return np.nonzero(mask)
+
+
+class CropIndex:
+    """(climate_zone, water_need, season) -> PhIntervalIndex, all keys lower-cased."""
+
+    def __init__(self, groups=None, ranked=None):
+        self.groups = groups or {}
+        self.ranked = ranked
+
+    @classmethod
+    def build(cls, crops, prices=None):
+        """
+        crops is a list of profile rows (dicts); prices maps crop name ->
+        market price (Rs/kg). Crops without a market price keep the
+        profile's own base_price.
+        """
+        if not crops:
+            return cls()
+
+        prices = prices or {}
+        joined = []
+        for row in crops:
+            price = prices.get(row["crop"], row["base_price"])
+            joined.append({**row, "base_price": price, "Profit_Index": row["base_yield"] * price})
+        joined.sort(key=_rank_key)
+
+        lowered = {col: [str(row[col]).lower() for row in joined] for col in KEY_COLUMNS}
+
+        # Every row is localized once; the groups and the batch arrays share
+        # the resulting dicts.
+        records = {lang: [_localize(r, lang) for r in joined] for lang in LANGS}
+        ranked = RankedCrops(joined, lowered, records)
+
+        # Groups in order of first appearance, positions in ranked order
+        positions = {}
+        for i, key in enumerate(zip(*(lowered[col] for col in KEY_COLUMNS))):
+            positions.setdefault(key, []).append(i)
+
+        groups = {}
+        for key, pos in positions.items():
+            groups[key] = PhIntervalIndex(
+                ranked.ph_min[pos], ranked.ph_max[pos],
+                {lang: [records[lang][i] for i in pos] for lang in LANGS},
+            )
+        return cls(groups, ranked)
+
+    def __bool__(self):
+        return bool(self.groups)
+
+    def lookup(self, climate_zone, water, season, ph, lang="en"):
+        entry = self.groups.get((climate_zone.lower(), water.lower(), season.lower()))
+        if entry is None:
+            return ()
+        if lang not in LANGS:
+            lang = "en"
+        return entry.probe(ph, lang)
+
+    def evaluate_batch(self, requests, season):
+        """
+        Evaluate many CropRequest-like objects at once.
+
+        Yields (request position, tuple of localized crops) in input order,
+        one broadcast block of BATCH_CHUNK requests at a time.
+        """
+        if self.ranked is None:
+            for pos in range(len(requests)):
+                yield pos, ()
+            return
+
+        ranked = self.ranked
+        season_code = ranked.encode("season", [season])[0]
+        for start in range(0, len(requests), BATCH_CHUNK):
+            chunk = requests[start:start + BATCH_CHUNK]
+            zone = ranked.encode("climate_zone", [r.climate_zone for r in chunk])
+            water = ranked.encode("water_need", [r.water for r in chunk])
+            seasons = np.full(len(chunk), season_code, dtype=np.int32)
+            ph = np.fromiter((r.soil_ph for r in chunk), dtype=float, count=len(chunk))
+
+            req_idx, row_idx = ranked.top_n(zone, water, seasons, ph)
+            # np.nonzero is row-major, so each request's hits are contiguous and ranked
+            splits = np.searchsorted(req_idx, np.arange(1, len(chunk)))
+            for offset, rows in enumerate(np.split(row_idx, splits)):
+                lang = chunk[offset].lang
+                records = ranked.records[lang if lang in LANGS else "en"]
+                yield start + offset, tuple(records[r] for r in rows)
+
+
+class StateCropIndex:
+    """normalized state -> CropIndex ranked by that state's mandi prices."""
+
+    def __init__(self, default=None, by_state=None):
+        self.default = default or CropIndex()
+        self.by_state = by_state or {}
+
+    @classmethod
+    def build(cls, crops, market):
+        default = CropIndex.build(crops, market.national_prices())
+        by_state = {state: CropIndex.build(crops, market.state_prices(state)) for state in market.states}
+        return cls(default, by_state)
+
+    def __bool__(self):
+        return bool(self.default)
+
+    def for_state(self, state):
+        return self.by_state.get(normalize_state(state), self.default)
+
+    def lookup(self, state, climate_zone, water, season, ph, lang="en"):
+        return self.for_state(state).lookup(climate_zone, water, season, ph, lang)
+
+    def evaluate_batch(self, requests, season):
+        """
+        CropIndex.evaluate_batch per state group, yielded in input order.
+
+        Requests are taken BATCH_CHUNK at a time, so a streamed response gets
+        its first lines once the first chunk is evaluated, not the whole batch.
+        """
+        for start in range(0, len(requests), BATCH_CHUNK):
+            chunk = requests[start:start + BATCH_CHUNK]
+            groups = {}
+            for offset, req in enumerate(chunk):
+                index = self.for_state(req.state)
+                groups.setdefault(id(index), (index, []))[1].append(offset)
+
+            results = [()] * len(chunk)
+            for index, offsets in groups.values():
+                sub = [chunk[o] for o in offsets]
+                for i, recommended in index.evaluate_batch(sub, season):
+                    results[offsets[i]] = recommended
+            for offset, recommended in enumerate(results):
+                yield start + offset, recommended
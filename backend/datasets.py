@@ -0,0 +1,273 @@
+"""
+datasets.py
+-----------
+Hot-reloadable registry of the data files behind the API.
+
+The registry watches crop_profiles.csv and market_prices.csv. A background
+thread polls their mtime/size and, when one changes, compares a SHA-256 of
+the content. If the content really changed, it builds a complete new
+DatasetSnapshot (profiles, mandi prices, crop index) off the request path
+and swaps it in with a single attribute assignment. Requests read
+registry.current once and use that snapshot throughout, so they never see a
+half-built state. A failed rebuild keeps the previous snapshot and is not
+retried until a file changes again, except while the empty fallback is
+being served: then every poll retries, so a transient error or a fixed
+permission does not leave the API without data.
+
+disease_remedies.json is not watched: its PlantVillage classes do not match
+the detector's disease keys, so nothing would read it.
+
+The crop profiles are read with the csv module into plain rows. The index
+and price modules (NumPy, and pandas for a cold mandi-feed ingest) are
+imported by build_snapshot, so nothing heavy is loaded until the first
+snapshot is built; registry.start(preload=False) defers that to the first
+request that needs the data.
+"""
+
+import csv
+import hashlib
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+import metrics
+
+BASE_DIR = Path(__file__).parent
+DATA_DIR = BASE_DIR / "data"
+RELOAD_INTERVAL = float(os.environ.get("DATASET_RELOAD_INTERVAL", 30))
+NUMERIC_COLUMNS = ("ph_min", "ph_max", "base_yield", "base_price")
+
+
+def _data_path(name):
+    # Make sure data directory exists, otherwise use base dir
+    path = DATA_DIR / name
+    return path if path.exists() else BASE_DIR / name
+
+
+DATA_FILES = {
+    "crops": _data_path("crop_profiles.csv"),
+    "prices": _data_path("market_prices.csv"),
+}
+
+
+class DatasetSnapshot:
+    """
+    One consistent, immutable-by-convention generation of every dataset.
+    An empty snapshot (no crop rows) has prices and crop_index set to None.
+    """
+
+    def __init__(self, crops=None, prices=None, crop_index=None,
+                 version=0, files=None, loaded_at=None):
+        self.crops = crops or []
+        self.prices = prices
+        self.crop_index = crop_index
+        self.version = version
+        self.files = files or {}
+        self.loaded_at = loaded_at
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def load_crops(path):
+    """
+    Crop profiles as a list of dict rows: lower-cased headers, NUMERIC_COLUMNS
+    as floats (NaN when blank) and other blank cells as None.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = [name.strip().lower() for name in next(reader, [])]
+        if "crop" not in header and "crop_name" in header:
+            header[header.index("crop_name")] = "crop"
+        crops = []
+        for values in reader:
+            if not values:
+                continue
+            row = {col: value if value != "" else None for col, value in zip(header, values)}
+            for col in NUMERIC_COLUMNS:
+                if col in row:
+                    row[col] = _number(row[col])
+            crops.append(row)
+    return crops
+
+
+def build_snapshot(paths, version, files):
+    """Load every dataset and derive the crop index; raises if the profiles fail."""
+    from crop_index import StateCropIndex
+    from market_prices import MarketPrices, load_market_prices
+
+    crops = load_crops(paths["crops"])
+
+    try:
+        prices = load_market_prices(paths["prices"], dict.fromkeys(row["crop"] for row in crops))
+    except Exception as e:
+        # Recommendations still work on the profiles' base prices
+        print(f"Error loading market prices: {e}")
+        prices = MarketPrices()
+
+    return DatasetSnapshot(
+        crops=crops,
+        prices=prices,
+        crop_index=StateCropIndex.build(crops, prices),
+        version=version,
+        files=files,
+        loaded_at=time.time(),
+    )
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _contents(files):
+    return {name: info and info[2] for name, info in files.items()}
+
+
+class DatasetRegistry:
+    """
+    Holds the current DatasetSnapshot and rebuilds it when a watched file's
+    content changes. The first access loads synchronously.
+    """
+
+    def __init__(self, paths=None, interval=RELOAD_INTERVAL):
+        self.paths = dict(paths or DATA_FILES)
+        self.interval = interval
+        self.last_error = None
+        self.last_checked = None
+        self._snapshot = None
+        self._stats = {}      # name -> (mtime_ns, size) last hashed
+        self._hashes = {}     # name -> sha256 of that content
+        self._failed = None   # file contents the last failed reload saw
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def current(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.reload()
+            snapshot = self._snapshot
+        return snapshot
+
+    def _fingerprint(self):
+        """name -> (mtime_ns, size, sha256); hashes only files whose stat moved."""
+        files = {}
+        for name, path in self.paths.items():
+            stat = _stat(path)
+            if stat is None:
+                files[name] = None
+                continue
+            if self._stats.get(name) != stat:
+                self._hashes[name] = _sha256(path)
+                self._stats[name] = stat
+            files[name] = (*stat, self._hashes[name])
+        return files
+
+    def reload(self, force=False):
+        """Rebuild and swap in a new snapshot if any file changed. Returns True on swap."""
+        with self._reload_lock:
+            self.last_checked = time.time()
+            contents = None
+            try:
+                files = self._fingerprint()
+                old = self._snapshot
+                contents = _contents(files)
+                if not force and old is not None:
+                    skip = [_contents(old.files)]
+                    if old.loaded_at is not None:
+                        # Only suppress a known-bad retry while real data is being served
+                        skip.append(self._failed)
+                    if contents in skip:
+                        return False
+
+                version = (old.version if old is not None else 0) + 1
+                with metrics.stage("dataset_load"):
+                    snapshot = build_snapshot(self.paths, version, files)
+
+                # A file rewritten while we read it is picked up on the next poll
+                if any(_stat(self.paths[n]) != (f and f[:2]) for n, f in files.items()):
+                    raise RuntimeError("data files changed during reload")
+            except Exception as e:
+                # Not retried until some file changes again (unless serving the fallback)
+                self._failed = contents
+                self.last_error = f"{type(e).__name__}: {e}"
+                metrics.count("dataset_reload_failed")
+                print(f"Error loading datasets: {self.last_error}")
+                if self._snapshot is None:
+                    # Serve empty data rather than failing every request; retried next poll
+                    self._snapshot = DatasetSnapshot(files={})
+                return False
+
+            self._snapshot = snapshot
+            self._failed = None
+            self.last_error = None
+            return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # Until something asks for the data there is nothing to refresh
+            if self._snapshot is not None:
+                self.reload()
+
+    def start(self, preload=True):
+        """Start polling; with preload the first snapshot is built before returning."""
+        if preload:
+            self.current
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="dataset-reloader", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def metadata(self):
+        snapshot = self.current
+        now = time.time()
+        return {
+            "version": snapshot.version,
+            "loaded_at": snapshot.loaded_at,
+            "age_seconds": None if snapshot.loaded_at is None else round(now - snapshot.loaded_at, 3),
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+            "reload_interval": self.interval,
+            "files": {
+                name: {
+                    "path": str(self.paths[name]),
+                    "exists": info is not None,
+                    "mtime": None if info is None else info[0] / 1e9,
+                    "size": None if info is None else info[1],
+                    "sha256": None if info is None else info[2],
+                }
+                for name, info in snapshot.files.items()
+            },
+        }
+
+
+registry = DatasetRegistry()
+
+metrics.register_callback(
+    "agrisaarthi_dataset_version", "Version of the dataset snapshot being served.",
+    lambda: registry._snapshot.version if registry._snapshot is not None else None)
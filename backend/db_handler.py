@@ -1,64 +1,359 @@
+import base64
+import queue
 import sqlite3
-import pandas as pd
+import threading
+
+import metrics
+from ml.disease_db import DISEASE_DB, DISEASE_KEYS, LANGS, localized
 
 DB_PATH = "farmer_history.db"
 
-def save_disease_history(
-    farmer_name,
-    crop,
-    disease,
-    remedy_en, precautions_en,
-    remedy_hi, precautions_hi,
-    remedy_ta, precautions_ta,
-    remedy_te, precautions_te,
-    remedy_ml, precautions_ml
-):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Create table if it doesn't exist, with columns for all 5 languages
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS disease_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            farmer_name TEXT,
-            crop TEXT,
-            disease TEXT,
-            remedy_en TEXT, precautions_en TEXT,
-            remedy_hi TEXT, precautions_hi TEXT,
-            remedy_ta TEXT, precautions_ta TEXT,
-            remedy_te TEXT, precautions_te TEXT,
-            remedy_ml TEXT, precautions_ml TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    # Insert new record
-    cursor.execute("""
-        INSERT INTO disease_history (
-            farmer_name, crop, disease,
-            remedy_en, precautions_en,
-            remedy_hi, precautions_hi,
-            remedy_ta, precautions_ta,
-            remedy_te, precautions_te,
-            remedy_ml, precautions_ml
+# Background writer tuning: bounded queue depth, rows per group commit and
+# how long the writer waits to fill a batch once it has a first row.
+WRITE_QUEUE_SIZE = 1000
+WRITE_BATCH_SIZE = 64
+WRITE_BATCH_WAIT = 0.05
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS disease_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        farmer_name TEXT,
+        crop TEXT,
+        disease TEXT,
+        disease_key TEXT,
+        lang TEXT,
+        remedy_en TEXT, precautions_en TEXT,
+        remedy_hi TEXT, precautions_hi TEXT,
+        remedy_ta TEXT, precautions_ta TEXT,
+        remedy_te TEXT, precautions_te TEXT,
+        remedy_ml TEXT, precautions_ml TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# Keyset pagination walks (timestamp, id) newest first; the filtered
+# variants lead with the equality column so the filter and the ORDER BY are
+# both served by one index range scan. Crop and disease filters both resolve
+# to disease keys (the display text is in the farmer's language), so one
+# index on disease_key serves them.
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_history_ts_id ON disease_history (timestamp DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_history_farmer ON disease_history (farmer_name, timestamp DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_history_disease ON disease_history (disease_key, timestamp DESC, id DESC)",
+)
+
+# Rows store the disease key and the farmer's language; the multilingual
+# remedy/precautions text is expanded from DISEASE_DB on read. The per-language
+# columns are only filled on rows written before the key existed.
+TEXT_FIELDS = tuple((field, lc) for lc in LANGS for field in ("remedy", "precautions"))
+TEXT_COLUMNS = tuple(f"{field}_{lc}" for field, lc in TEXT_FIELDS)
+ADDED_COLUMNS = (("disease_key", "TEXT"), ("lang", "TEXT"))
+
+HISTORY_LANGS = LANGS
+HISTORY_PAGE_SIZE = 50
+
+# Kept as one constant string so sqlite3's statement cache reuses the
+# prepared statement for every insert.
+INSERT_SQL = """
+    INSERT INTO disease_history (farmer_name, crop, disease, disease_key, lang)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+_local = threading.local()
+_migrate_lock = threading.Lock()
+_migrated_path = None
+
+
+def get_connection():
+    """Return this thread's connection to DB_PATH, opening it in WAL mode on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != DB_PATH:
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn, _local.path = conn, DB_PATH
+    return conn
+
+
+def begin_write(conn):
+    """
+    Open a write transaction, timing the wait for SQLite's write lock (held
+    by whichever connection is committing) as the db_lock_wait stage.
+    """
+    with metrics.stage("db_lock_wait"):
+        conn.execute("BEGIN IMMEDIATE")
+
+
+def init_db():
+    """Run the schema migration once per database path."""
+    global _migrated_path
+    with _migrate_lock:
+        if _migrated_path == DB_PATH:
+            return
+        conn = get_connection()
+        conn.execute(SCHEMA)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(disease_history)")}
+        for name, kind in ADDED_COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE disease_history ADD COLUMN {name} {kind}")
+        if "disease_key" not in existing:
+            normalize_legacy_rows(conn)
+        drop_stale_indexes(conn)
+        for ddl in INDEXES:
+            conn.execute(ddl)
+        conn.commit()
+        _migrated_path = DB_PATH
+
+
+def normalize_legacy_rows(conn):
+    """
+    Replace the copied multilingual text of old rows with their disease key,
+    but only where every column still matches DISEASE_DB exactly.
+    """
+    clear = ", ".join(f"{col} = NULL" for col in TEXT_COLUMNS)
+    match = " AND ".join(f"{col} = ?" for col in TEXT_COLUMNS)
+    for key in DISEASE_KEYS:
+        texts = [localized(key, field, lc) for field, lc in TEXT_FIELDS]
+        conn.execute(
+            f"UPDATE disease_history SET disease_key = ?, {clear} WHERE disease_key IS NULL AND {match}",
+            [key] + texts,
         )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        farmer_name, crop, disease,
-        remedy_en, precautions_en,
-        remedy_hi, precautions_hi,
-        remedy_ta, precautions_ta,
-        remedy_te, precautions_te,
-        remedy_ml, precautions_ml
-    ))
-    
-    conn.commit()
-    conn.close()
-
-
-def get_disease_history():
-    conn = sqlite3.connect(DB_PATH)
-    query = "SELECT * FROM disease_history ORDER BY timestamp DESC"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
\ No newline at end of file
+
+
+def drop_stale_indexes(conn):
+    """Drop history indexes that INDEXES no longer lists or now defines differently."""
+    wanted = {ddl.split()[5]: ddl.split(" ON ", 1)[1] for ddl in INDEXES}
+    existing = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'disease_history' AND sql IS NOT NULL"
+    ).fetchall()
+    for name, sql in existing:
+        if wanted.get(name) != sql.split(" ON ", 1)[1]:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def _filter_names(field):
+    """Lower-cased display name in any language -> disease keys it names."""
+    names = {}
+    for key in DISEASE_KEYS:
+        for text in DISEASE_DB[key][field].values():
+            names.setdefault(text.casefold(), set()).add(key)
+    return names
+
+
+# ?crop= and ?disease= accept a name in any of LANGS; ?disease= also takes the key
+FILTER_KEYS = {"crop": _filter_names("crop"), "disease": _filter_names("disease")}
+for _key in DISEASE_KEYS:
+    FILTER_KEYS["disease"].setdefault(_key.casefold(), set()).add(_key)
+
+
+def filter_keys(field, value):
+    """Sorted disease keys a crop/disease filter value names (empty if none)."""
+    return sorted(FILTER_KEYS[field].get(value.strip().casefold(), ()))
+
+
+class HistoryWriter:
+    """
+    Single background thread that drains a bounded queue of history rows and
+    group-commits them in small batches. Each queue item is a list of rows
+    that always lands in the same transaction. A full queue blocks the
+    producer. A group that fails to commit is logged and dropped; the thread
+    keeps draining the queue.
+    """
+
+    _STOP = object()
+
+    def __init__(self, maxsize=WRITE_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, rows):
+        with metrics.stage("history_enqueue"):
+            self.queue.put(rows)
+
+    def flush(self):
+        """Block until every queued row has been committed."""
+        self.queue.join()
+
+    def stop(self):
+        self.queue.put(self._STOP)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            stopping = batch[0] is self._STOP
+            while not stopping and len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    item = self.queue.get(timeout=WRITE_BATCH_WAIT)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                batch.append(item)
+
+            rows = [row for item in batch if item is not self._STOP for row in item]
+            if rows:
+                self._write(rows)
+            for _ in batch:
+                self.queue.task_done()
+            if stopping:
+                return
+
+    def _write(self, rows):
+        """Commit one group of rows. Any failure drops this group only, never the thread."""
+        conn = None
+        try:
+            init_db()
+            conn = get_connection()
+            begin_write(conn)
+            with metrics.stage("db_insert"):
+                conn.executemany(INSERT_SQL, rows)
+                conn.commit()
+        except Exception as e:
+            if conn is not None and conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+            if isinstance(e, sqlite3.OperationalError) and "locked" in str(e):
+                metrics.count("db_locked")
+            metrics.count("history_write_failed")
+            print(f"Error writing disease history ({len(rows)} rows dropped): {type(e).__name__}: {e}")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            init_db()
+            _writer = HistoryWriter()
+    return _writer
+
+
+def shutdown_writer():
+    """Flush pending rows and stop the writer thread (called on app shutdown)."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
+
+
+metrics.register_callback(
+    "agrisaarthi_history_queue_depth", "History row batches waiting for the background writer.",
+    lambda: _writer.queue.qsize() if _writer is not None else None)
+
+
+def flush_history():
+    if _writer is not None:
+        _writer.flush()
+
+
+def save_disease_history(farmer_name, crop, disease, disease_key, lang):
+    # Queued for the background writer; committed within WRITE_BATCH_WAIT
+    start_writer().submit([(farmer_name, crop, disease, disease_key, lang)])
+
+
+def save_disease_history_many(rows):
+    """
+    Queue several history rows (tuples in save_disease_history's argument
+    order) to be committed together in one transaction.
+    """
+    rows = [tuple(r) for r in rows]
+    if rows:
+        start_writer().submit(rows)
+
+
+def encode_cursor(timestamp, row_id):
+    return base64.urlsafe_b64encode(f"{timestamp}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return timestamp, int(row_id)
+    except Exception:
+        raise ValueError("Invalid history cursor")
+
+
+def get_disease_history(
+    limit=HISTORY_PAGE_SIZE,
+    cursor=None,
+    farmer_name=None,
+    crop=None,
+    disease=None,
+    start=None,
+    end=None,
+    lang=None,
+):
+    """
+    One page of history rows, newest first, plus the cursor for the next page
+    (None on the last page). Dates are inclusive 'YYYY-MM-DD' strings. crop
+    and disease match rows in every language: they take the English (or any
+    localized) name, and disease also takes the key, e.g. "Leaf_Rust". With
+    lang set only that language's remedy/precautions fields are returned.
+    """
+    if lang is not None and lang not in HISTORY_LANGS:
+        raise ValueError(f"Unsupported language: {lang}")
+    langs = (lang,) if lang else HISTORY_LANGS
+    columns = ["id", "farmer_name", "crop", "disease", "disease_key", "lang"]
+    for lc in langs:
+        columns += [f"remedy_{lc}", f"precautions_{lc}"]
+    columns.append("timestamp")
+
+    where, params = [], []
+    if farmer_name is not None:
+        where.append("farmer_name = ?")
+        params.append(farmer_name)
+    for col, value in (("crop", crop), ("disease", disease)):
+        if value is None:
+            continue
+        keys = filter_keys(col, value)
+        if keys:
+            where.append(f"disease_key IN ({', '.join('?' * len(keys))})")
+            params.extend(keys)
+        else:
+            # Not a known crop/disease: match the stored display text as before
+            where.append(f"{col} = ?")
+            params.append(value)
+    if start is not None:
+        where.append("timestamp >= ?")
+        params.append(str(start))
+    if end is not None:
+        where.append("timestamp < date(?, '+1 day')")
+        params.append(str(end))
+    if cursor is not None:
+        where.append("(timestamp, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+
+    query = f"SELECT {', '.join(columns)} FROM disease_history"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    init_db()
+    with metrics.stage("history_query"):
+        rows = get_connection().execute(query, params).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][-1], rows[-1][0])
+    history = []
+    for row in rows:
+        item = {col: ("" if v is None else v) for col, v in zip(columns, row)}
+        key = item["disease_key"]
+        if key in DISEASE_KEYS:
+            for lc in langs:
+                item[f"remedy_{lc}"] = localized(key, "remedy", lc)
+                item[f"precautions_{lc}"] = localized(key, "precautions", lc)
+        history.append(item)
+    return history, next_cursor
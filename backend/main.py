@@ -1,16 +1,46 @@
 import os
-import tempfile
+import json
+import math
 import datetime
-import pandas as pd
-from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
-from ml.disease_detector import predict_disease
-from db_handler import save_disease_history, get_disease_history
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from ml.disease_db import LANGS, dumps, localized, render_fields
+from db_handler import save_disease_history, save_disease_history_many, get_disease_history, init_db, start_writer, shutdown_writer
+from datasets import registry
+from sensors import store as sensor_store, to_epoch, MAX_READINGS_PER_BATCH
+from analysis_pool import run_analysis, start_pool, shutdown_pool, PoolSaturated, PoolBroken, AnalysisTimeout
+from prediction_cache import get_cache, close_cache
+import metrics
+from metrics import stage
+from uploads import read_form, form_text, form_files, form_openapi
 
-app = FastAPI(title="AgriSaarthi API")
+# Lean startup: crop data (and NumPy with it) is loaded by the first request
+# that needs it instead of before the server accepts connections.
+LEAN_STARTUP = os.environ.get("LEAN_STARTUP", "0") == "1"
+
+# Analysis jobs by name, so only the pool's workers import NumPy and PIL
+CLASSIFY_LEAF = "ml.disease_detector:classify_leaf"
+CLASSIFY_LEAVES = "ml.disease_detector:classify_leaves"
+
+@asynccontextmanager
+async def lifespan(app):
+    init_db()
+    start_writer()
+    start_pool()
+    registry.start(preload=not LEAN_STARTUP)
+    yield
+    registry.stop()
+    shutdown_pool()
+    close_cache()
+    # Flush queued history rows before the worker exits
+    shutdown_writer()
+
+app = FastAPI(title="AgriSaarthi API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,35 +50,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-BASE_DIR = Path(__file__).parent
-CROP_DATA_PATH = BASE_DIR / "data" / "crop_profiles.csv"
-PRICE_DATA_PATH = BASE_DIR / "data" / "market_prices.csv"
-
-# Make sure data directory exists, otherwise use base dir
-if not CROP_DATA_PATH.exists():
-    CROP_DATA_PATH = BASE_DIR / "crop_profiles.csv"
-if not PRICE_DATA_PATH.exists():
-    PRICE_DATA_PATH = BASE_DIR / "market_prices.csv"
-
-def load_crop_data():
-    try:
-        crops = pd.read_csv(CROP_DATA_PATH)
-        prices = pd.read_csv(PRICE_DATA_PATH)
-
-        crops.columns = crops.columns.str.strip().str.lower()
-        prices.columns = prices.columns.str.strip().str.lower()
-
-        if "crop" not in crops.columns and "crop_name" in crops.columns:
-            crops = crops.rename(columns={"crop_name": "crop"})
-        if "crop" not in prices.columns and "crop_name" in prices.columns:
-            prices = prices.rename(columns={"crop_name": "crop"})
-
-        return crops, prices
-    except Exception as e:
-        print(f"Error loading crop data: {e}")
-        return pd.DataFrame(), pd.DataFrame()
-
-crops, prices = load_crop_data()
+if metrics.METRICS_PROFILING:
+    # Requests sent with "X-Profile: 1" are sampled; see metrics.py
+    app.add_middleware(metrics.ProfilerMiddleware)
 
 class CropRequest(BaseModel):
     state: str
@@ -57,101 +61,242 @@ class CropRequest(BaseModel):
     water: str
     lang: str = "en"
 
+def current_season():
+    month = datetime.datetime.now().month
+    return ("Rainy / Monsoon" if month in [6, 7, 8, 9, 10]
+            else "Winter" if month in [11, 12, 1, 2, 3]
+            else "Summer")
+
 @app.post("/api/recommend_crop")
 def recommend_crop(req: CropRequest):
-    if crops.empty or prices.empty:
+    data = registry.current
+    if not data.crops:
         raise HTTPException(status_code=500, detail="Crop data not available")
 
-    month = datetime.datetime.now().month
-    season = ("Rainy / Monsoon" if month in [6, 7, 8, 9, 10]
-              else "Winter" if month in [11, 12, 1, 2, 3]
-              else "Summer")
-
-    filtered = crops[
-        (crops["ph_min"] <= req.soil_ph) &
-        (crops["ph_max"] >= req.soil_ph) &
-        (crops["water_need"].str.lower() == req.water.lower()) &
-        (crops["climate_zone"].str.lower() == req.climate_zone.lower()) &
-        (crops["season"].str.lower() == season.lower())
-    ]
-
-    if filtered.empty:
+    season = current_season()
+    with stage("recommend_lookup"):
+        recommended = data.crop_index.lookup(req.state, req.climate_zone, req.water, season, req.soil_ph, req.lang)
+    if not recommended:
         return {"success": False, "message": "No matching crops found", "crops": []}
 
-    result = pd.merge(filtered, prices, on="crop", how="inner")
-    result["Profit_Index"] = result["base_yield"] * result["base_price"]
-    result = result.sort_values("Profit_Index", ascending=False).head(3)
-
-    recommended = []
-    for _, row in result.iterrows():
-        # Get localized name
-        crop_name = row.get(f"crop_{req.lang}", row["crop"]) if req.lang in ["hi", "ta", "te", "ml"] else row["crop"]
-        recommended.append({
-            "crop": crop_name,
-            "profit_index": float(row["Profit_Index"]),
-            "water_need": row["water_need"],
-            "carbon_footprint": row.get("carbon_footprint", "N/A"),
-            "sowing_months": row.get("sowing_months", "N/A"),
-            "fertilizer": row.get("fertilizer", "N/A")
-        })
-
-    return {"success": True, "crops": recommended}
-
-@app.post("/api/detect_disease")
-async def detect_disease(
-    farmer_name: str = Form(...),
-    lang: str = Form("en"),
-    file: UploadFile = File(...)
-):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
+    return {"success": True, "crops": list(recommended)}
 
-    try:
-        result = predict_disease(tmp_path, lang=lang)
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
-
-    # Resolve language specific text for display
-    if lang in ["hi", "ta", "te", "ml"]:
-        disease_display = result.get(f"disease_{lang}", result["disease"]).replace("_", " ")
-        crop_display = result.get(f"crop_{lang}", result["crop"])
-        remedy_display = result.get(f"remedy_{lang}", result["remedy"])
-        precautions_display = result.get(f"precautions_{lang}", result["precautions"])
-    else:
-        disease_display = result["disease"].replace("_", " ")
-        crop_display = result["crop"]
-        remedy_display = result["remedy"]
-        precautions_display = result["precautions"]
-
-    save_disease_history(
-        farmer_name, crop_display, disease_display,
-        result.get("remedy_en", ""), result.get("precautions_en", ""),
-        result.get("remedy_hi", ""), result.get("precautions_hi", ""),
-        result.get("remedy_ta", ""), result.get("precautions_ta", ""),
-        result.get("remedy_te", ""), result.get("precautions_te", ""),
-        result.get("remedy_ml", ""), result.get("precautions_ml", ""),
+MAX_CROP_BATCH = 10000
+
+@app.post("/api/recommend_crop/batch")
+def recommend_crop_batch(reqs: List[CropRequest]):
+    """
+    Recommend crops for many fields at once, e.g. every field of a cooperative.
+    Streams one NDJSON line per request, in input order, tagged with its index.
+    """
+    if len(reqs) > MAX_CROP_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_CROP_BATCH} fields per request")
+    data = registry.current
+    if not data.crops:
+        raise HTTPException(status_code=500, detail="Crop data not available")
+
+    # The stream keeps using this snapshot even if a reload swaps in a new one
+    index = data.crop_index
+    season = current_season()
+
+    def lines():
+        for pos, recommended in index.evaluate_batch(reqs, season):
+            if recommended:
+                item = {"index": pos, "success": True, "crops": list(recommended)}
+            else:
+                item = {"index": pos, "success": False, "message": "No matching crops found", "crops": []}
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+MAX_BATCH_IMAGES = 64
+# Upload limits (413 beyond them): per image, and for a whole batch request.
+# Both are enforced while the body streams in, see uploads.read_form
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", 15 * 1024 * 1024))
+MAX_BATCH_BYTES = int(os.environ.get("MAX_BATCH_BYTES", 48 * 1024 * 1024))
+# Images per pool job in a batch; each job gets the normal analysis timeout
+BATCH_JOB_IMAGES = 4
+
+def history_row(farmer_name, key, lang):
+    """Arguments for save_disease_history: display names plus the disease key."""
+    lang = lang if lang in LANGS else "en"
+    return (
+        farmer_name,
+        localized(key, "crop", lang),
+        localized(key, "disease", lang).replace("_", " "),
+        key, lang,
     )
 
-    return {
-        "success": True,
-        "disease": disease_display,
-        "crop": crop_display,
-        "remedy": remedy_display,
-        "precautions": precautions_display,
-        "confidence": result.get("confidence", 0)
-    }
+def render_detection(key, conf, lang):
+    """JSON members of one detection: pre-rendered display fields + confidence."""
+    return render_fields(key, lang) + b',"confidence":' + dumps(conf)
+
+async def analyse(target, *args):
+    """Run a job in the analysis pool, mapping pool errors to HTTP responses."""
+    try:
+        return await run_analysis(target, *args)
+    except PoolSaturated:
+        raise HTTPException(status_code=503, detail="Disease detection is busy, please retry shortly",
+                            headers={"Retry-After": "2"})
+    except PoolBroken:
+        raise HTTPException(status_code=503, detail="Disease detection is restarting, please retry shortly",
+                            headers={"Retry-After": "2"})
+    except AnalysisTimeout:
+        raise HTTPException(status_code=504, detail="Disease detection timed out")
+
+@app.post("/api/detect_disease", openapi_extra=form_openapi("file"))
+async def detect_disease(request: Request):
+    """
+    Form fields farmer_name, lang (default "en") and one image as file. The
+    form is parsed in memory (see uploads.py), so photos never hit the disk.
+    """
+    with stage("upload_read"):
+        form = await read_form(request, MAX_IMAGE_BYTES)
+        farmer_name = form_text(form, "farmer_name")
+        lang = form_text(form, "lang", "en")
+        file = form_files(form, "file")[0]
+        content = await file.read()
+
+    # Repeat uploads are answered from the content-addressed cache
+    cache = get_cache()
+    [(digest, label)] = await run_in_threadpool(cache.lookup, [content])
+    if label is None:
+        label = await analyse(CLASSIFY_LEAF, content)
+        await run_in_threadpool(cache.put, digest, label)
+    key, conf = label
+
+    # The history queue blocks when full, so enqueue from the threadpool
+    await run_in_threadpool(save_disease_history, *history_row(farmer_name, key, lang))
+
+    body = b'{"success":true,' + render_detection(key, conf, lang) + b"}"
+    return Response(content=body, media_type="application/json")
+
+@app.post("/api/detect_disease/batch", openapi_extra=form_openapi("files", many=True))
+async def detect_disease_batch(request: Request):
+    """
+    Analyse a whole field survey in one upload: form fields farmer_name, lang
+    and up to MAX_BATCH_IMAGES images as files. The body is capped at
+    MAX_BATCH_BYTES while it streams in: a larger one is refused unread.
+    Images that are not cached are decoded and classified BATCH_JOB_IMAGES
+    at a time, one analysis job after another, so a worker never holds the
+    whole survey and each job stays within the normal timeout. Results come
+    back in upload order and all history rows are committed in one
+    transaction.
+    """
+    with stage("upload_read_batch"):
+        form = await read_form(request, MAX_BATCH_BYTES, max_files=MAX_BATCH_IMAGES,
+                               max_file_bytes=MAX_IMAGE_BYTES)
+        farmer_name = form_text(form, "farmer_name")
+        lang = form_text(form, "lang", "en")
+        files = form_files(form, "files")
+        contents = [await f.read() for f in files]
+
+    cache = get_cache()
+    cached = await run_in_threadpool(cache.lookup, contents)
+    labels = [label for _, label in cached]
+    missing = [i for i, label in enumerate(labels) if label is None]
+    for start in range(0, len(missing), BATCH_JOB_IMAGES):
+        part = missing[start:start + BATCH_JOB_IMAGES]
+        fresh = await analyse(CLASSIFY_LEAVES, [contents[i] for i in part])
+        for i, label in zip(part, fresh):
+            labels[i] = label
+        await run_in_threadpool(cache.put_many, [(cached[i][0], labels[i]) for i in part])
+
+    await run_in_threadpool(save_disease_history_many, [
+        history_row(farmer_name, key, lang) for key, _ in labels
+    ])
+
+    items = [
+        b'{"filename":' + dumps(upload.filename) + b"," + render_detection(key, conf, lang) + b"}"
+        for upload, (key, conf) in zip(files, labels)
+    ]
+    body = b'{"success":true,"results":[' + b",".join(items) + b"]}"
+    return Response(content=body, media_type="application/json")
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    return {"success": True, "cache": get_cache().stats()}
 
 @app.get("/api/history")
-def get_history():
+def get_history(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    farmer_name: Optional[str] = None,
+    crop: Optional[str] = None,
+    disease: Optional[str] = None,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    lang: Optional[str] = None,
+):
     try:
-        df = get_disease_history()
-        # Convert df to list of dicts, handle NaN and NAT
-        return {"success": True, "history": df.fillna("").to_dict(orient="records")}
+        history, next_cursor = get_disease_history(
+            limit=limit, cursor=cursor,
+            farmer_name=farmer_name, crop=crop, disease=disease,
+            start=start, end=end, lang=lang,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        return {"success": False, "message": str(e), "history": []}
+        return {"success": False, "message": str(e), "history": [], "next_cursor": None}
+    with stage("history_serialize"):
+        body = dumps({"success": True, "history": history, "next_cursor": next_cursor})
+    return Response(content=body, media_type="application/json")
+
+class SensorReading(BaseModel):
+    device_id: str
+    timestamp: datetime.datetime
+    temperature: Optional[float] = None
+    humidity: Optional[float] = None
+    soil_moisture: Optional[float] = None
+
+@app.post("/api/sensors/readings")
+def ingest_sensor_readings(readings: List[SensorReading]):
+    """Store a batch of field-sensor readings and update the rolling windows."""
+    if len(readings) > MAX_READINGS_PER_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_READINGS_PER_BATCH} readings per request")
+    rows = [
+        (r.device_id, to_epoch(r.timestamp), r.temperature, r.humidity, r.soil_moisture)
+        for r in readings
+    ]
+    # Checked here rather than with allow_inf_nan=False: the validation error
+    # would echo the NaN back and fail to serialize itself
+    if any(v is not None and not math.isfinite(v) for row in rows for v in row[2:]):
+        raise HTTPException(status_code=422, detail="Sensor values must be finite numbers")
+    stored, late = sensor_store.ingest(rows)
+    return {"success": True, "stored": stored, "late": late}
+
+@app.get("/api/sensors/{device_id}/aggregates")
+def sensor_aggregates(device_id: str):
+    """min/max/mean over the device's last 1h and 24h, from the rolling windows."""
+    aggregates = sensor_store.aggregates(device_id)
+    if aggregates is None:
+        raise HTTPException(status_code=404, detail="Unknown device")
+    return {"success": True, "device_id": device_id, **aggregates}
+
+@app.get("/api/sensors/{device_id}/readings")
+def sensor_readings(
+    device_id: str,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    readings = sensor_store.readings(device_id, start=start, end=end, limit=limit)
+    return {"success": True, "device_id": device_id, "readings": readings}
+
+@app.get("/api/datasets")
+def dataset_info():
+    return {"success": True, "datasets": registry.metadata()}
+
+@app.post("/api/datasets/reload")
+def reload_datasets():
+    """Check the data files now instead of waiting for the next poll."""
+    changed = registry.reload()
+    return {"success": registry.last_error is None, "reloaded": changed, "datasets": registry.metadata()}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Stage latency histograms, counters and gauges in Prometheus text format."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/")
 def read_root():
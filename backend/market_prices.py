@@ -0,0 +1,240 @@
+"""
+market_prices.py
+----------------
+Ingestion of the Agmarknet-style mandi feed (data/market_prices.csv).
+
+The CSV is read in chunks of typed, categorical columns. Commodity names are
+mapped onto the crop names of crop_profiles.csv and the modal price is
+averaged per (state, crop) with exponential recency weighting. The result is
+a small state x crop price matrix in Rs/kg (Rs per unit for commodities
+sold by count, see UNIT_DIVISORS), cached next to the CSV as .npz and reused
+until the CSV (or the crop list) changes. An unreadable cache is rebuilt. pandas is only
+imported when the feed actually has to be ingested.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+FEED_COLUMNS = {
+    "State": "state",
+    "Commodity": "commodity",
+    "Arrival_Date": "arrival_date",
+    "Modal_x0020_Price": "modal_price",
+}
+DATE_FORMAT = "%d/%m/%Y"
+CHUNK_ROWS = 100_000
+HALF_LIFE_DAYS = 7.0   # a price this many days older than the newest counts half
+QUINTAL_KG = 100       # mandi prices are Rs/quintal, crop profiles use Rs/kg
+CACHE_VERSION = 2
+
+# Feed commodities (lower-cased) not priced per quintal: divisor from the feed
+# price to the profile's unit price, used instead of QUINTAL_KG.
+UNIT_DIVISORS = {
+    "coconut": 1000,   # Rs per 1000 nuts; crop_profiles.csv prices one nut
+}
+
+# Feed commodity (lower-cased) -> crop_profiles.csv crop, where the generic
+# rules in normalize_commodity cannot find it.
+COMMODITY_ALIASES = {
+    "paddy(dhan)(common)": "Rice",
+    "paddy(dhan)(basmati)": "Rice",
+    "cucumbar(kheera)": "Cucumber",
+    "soyabean": "Soybean",
+    "bengal gram(gram)(whole)": "Chickpea",
+    "kabuli chana(chickpeas-white)": "Chickpea",
+    "peas wet": "Peas",
+    "green peas": "Peas",
+    "field pea": "Peas",
+    "peas cod": "Peas",
+    "mustard": "Rapeseed",
+    "water melon": "Watermelon",
+    "sweet pumpkin": "Pumpkin",
+}
+
+STATE_ALIASES = {
+    "uttrakhand": "uttarakhand",
+    "orissa": "odisha",
+    "chattisgarh": "chhattisgarh",
+    "pondicherry": "puducherry",
+}
+
+_PARENS = re.compile(r"\s*\(([^)]*)\)")
+
+
+def normalize_state(name):
+    """Lower-cased, whitespace-collapsed state name with known misspellings fixed."""
+    key = " ".join(str(name).split()).lower()
+    return STATE_ALIASES.get(key, key)
+
+
+def unit_divisor(commodity):
+    """Divisor turning the feed's price for commodity into the profile's unit price."""
+    return UNIT_DIVISORS.get(" ".join(str(commodity).split()).lower(), QUINTAL_KG)
+
+
+def normalize_commodity(commodity, crops_by_lower):
+    """
+    Map a feed commodity to a profile crop name, or None.
+
+    Tries the alias table, the name without parentheticals or a ' - variety'
+    suffix ('Barley (Jau)', 'Banana - Green'), the parenthetical itself
+    ('Jowar(Sorghum)') and a plural form ('Lentil' -> 'Lentils').
+    """
+    lowered = " ".join(str(commodity).split()).lower()
+    if lowered in COMMODITY_ALIASES:
+        return COMMODITY_ALIASES[lowered]
+    base = _PARENS.sub("", lowered).split(" - ")[0].strip()
+    for candidate in [base, *_PARENS.findall(lowered)]:
+        for name in (candidate, candidate + "s"):
+            if name in crops_by_lower:
+                return crops_by_lower[name]
+    return None
+
+
+class MarketPrices:
+    """Recency-weighted modal prices (Rs/kg) per state and crop."""
+
+    def __init__(self, states=(), crops=(), matrix=None, national=None):
+        self.states = tuple(states)
+        self.crops = tuple(crops)
+        self.matrix = np.empty((0, 0), dtype=np.float32) if matrix is None else matrix
+        self.national = np.empty(0, dtype=np.float32) if national is None else national
+        self._rows = {s: i for i, s in enumerate(self.states)}
+
+    def __bool__(self):
+        return bool(self.crops)
+
+    def _as_dict(self, values):
+        return {c: round(float(v), 2) for c, v in zip(self.crops, values) if not np.isnan(v)}
+
+    def national_prices(self):
+        return self._as_dict(self.national)
+
+    def state_prices(self, state):
+        """The state's prices, with national prices for crops it did not trade."""
+        row = self._rows.get(normalize_state(state))
+        if row is None:
+            return self.national_prices()
+        return self._as_dict(np.where(np.isnan(self.matrix[row]), self.national, self.matrix[row]))
+
+
+def _aggregate(path, crop_names, chunk_rows=CHUNK_ROWS):
+    """Stream the feed and reduce it to per-(state, crop) weighted sums."""
+    import pandas as pd
+
+    crops_by_lower = {c.lower(): c for c in crop_names}
+    ref = None
+    partials = []
+
+    reader = pd.read_csv(
+        path,
+        usecols=list(FEED_COLUMNS),
+        dtype={"State": "category", "Commodity": "category", "Arrival_Date": "category"},
+        chunksize=chunk_rows,
+    )
+    for chunk in reader:
+        chunk = chunk.rename(columns=FEED_COLUMNS)
+
+        # Per-category work: a chunk has few distinct names and dates
+        names = chunk["commodity"].cat.categories
+        commodity = chunk["commodity"].map({c: normalize_commodity(c, crops_by_lower) for c in names}).astype(object)
+        divisor = chunk["commodity"].map({c: unit_divisor(c) for c in names}).astype(np.float64)
+        state = chunk["state"].map({s: normalize_state(s) for s in chunk["state"].cat.categories}).astype(object)
+        dates = chunk["arrival_date"].cat.categories
+        parsed = pd.to_datetime(pd.Series(dates), format=DATE_FORMAT, errors="coerce")
+        day = chunk["arrival_date"].map(dict(zip(dates, parsed))).astype("datetime64[ns]")
+        price = pd.to_numeric(chunk["modal_price"], errors="coerce") / divisor
+
+        frame = pd.DataFrame({"state": state, "crop": commodity, "day": day, "price": price})
+        frame = frame.dropna()
+        frame = frame[frame["price"] > 0]
+        if frame.empty:
+            continue
+
+        # Weights are 2**(t / half-life) against a fixed reference day; the
+        # reference cancels out in the weighted mean.
+        if ref is None:
+            ref = frame["day"].min()
+        age = (frame["day"] - ref).dt.days.to_numpy(dtype=np.float64)
+        weight = np.exp2(age / HALF_LIFE_DAYS)
+        frame = frame.assign(w=weight, wp=weight * frame["price"].to_numpy())
+        partials.append(frame.groupby(["state", "crop"], observed=True)[["w", "wp"]].sum())
+
+    if not partials:
+        return None
+    return pd.concat(partials).groupby(level=["state", "crop"]).sum()
+
+
+def ingest(path, crop_names):
+    """Build MarketPrices from the raw feed."""
+    sums = _aggregate(path, crop_names)
+    if sums is None:
+        return MarketPrices()
+
+    wide = sums.unstack("crop")
+    states = [str(s) for s in wide.index]
+    crops = [str(c) for c in wide["w"].columns]
+    matrix = (wide["wp"] / wide["w"]).to_numpy(dtype=np.float32)
+    by_crop = sums.groupby(level="crop").sum()
+    national = (by_crop["wp"] / by_crop["w"]).reindex(crops).to_numpy(dtype=np.float32)
+    return MarketPrices(states, crops, matrix, national)
+
+
+def _cache_key(path, crop_names):
+    stat = os.stat(path)
+    names = hashlib.md5("\n".join(sorted(crop_names)).encode()).hexdigest()
+    return f"{CACHE_VERSION}:{stat.st_mtime_ns}:{stat.st_size}:{names}"
+
+
+def cache_path_for(path):
+    return Path(path).with_suffix(".npz")
+
+
+def load_market_prices(path, crop_names):
+    """
+    MarketPrices for the feed at path, from the .npz cache when it matches
+    the CSV and crop list, otherwise ingested and written back to the cache.
+    """
+    path = Path(path)
+    crop_names = [str(c) for c in crop_names]
+    key = _cache_key(path, crop_names)
+    cache = cache_path_for(path)
+
+    if cache.exists():
+        try:
+            with np.load(cache, allow_pickle=False) as data:
+                if str(data["key"]) == key:
+                    return MarketPrices(data["states"].tolist(), data["crops"].tolist(),
+                                        data["matrix"], data["national"])
+        except Exception as e:
+            # Truncated or corrupt (BadZipFile, EOFError, ...): rebuild it below
+            print(f"Ignoring market price cache {cache}: {type(e).__name__}: {e}")
+
+    prices = ingest(path, crop_names)
+    _write_cache(cache, key, prices)
+    return prices
+
+
+def _write_cache(cache, key, prices):
+    """
+    Write through a temp file unique to this process, so workers ingesting
+    at the same time never write into each other's file before the replace.
+    """
+    tmp = None
+    try:
+        with tempfile.NamedTemporaryFile(dir=cache.parent, prefix=cache.name + ".", suffix=".tmp",
+                                         delete=False) as f:
+            tmp = f.name
+            np.savez(f, key=np.array(key), states=np.array(prices.states, dtype=str),
+                     crops=np.array(prices.crops, dtype=str),
+                     matrix=prices.matrix, national=prices.national)
+        os.replace(tmp, cache)
+    except OSError as e:
+        print(f"Could not write market price cache {cache}: {e}")
+        if tmp is not None:
+            Path(tmp).unlink(missing_ok=True)
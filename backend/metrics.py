@@ -0,0 +1,309 @@
+"""
+metrics.py
+----------
+Per-stage latency histograms and counters, exposed as Prometheus text.
+
+Code wraps the interesting parts of a request in `with stage("name"):` and
+the time lands in agrisaarthi_stage_seconds{stage="name"}. Scrape-time
+gauges read live values (pool depth, queue depth, cache hits) through
+callbacks, so they cost nothing between scrapes. With METRICS_ENABLED=0
+stage() hands back a shared no-op context manager and nothing is recorded.
+
+Work done in analysis-pool processes is timed there and shipped back with
+the result (see call_recorded), so it shows up in this process's histograms.
+
+Setting METRICS_PROFILING=1 additionally lets a single request be profiled
+by sending an `X-Profile: 1` header: a sampling profiler snapshots every
+thread's stack each PROFILE_INTERVAL seconds while that request runs and
+writes the collapsed stacks (flamegraph.pl / speedscope format) to
+PROFILE_DIR. The response names the file in an X-Profile header; only the
+newest PROFILE_MAX_FILES profiles are kept.
+"""
+
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+from pathlib import Path
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+METRICS_PROFILING = os.environ.get("METRICS_PROFILING", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 50))
+
+# Upper bounds in seconds, from sub-millisecond lookups to slow image decodes
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_METRIC = "agrisaarthi_stage_seconds"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by one label (the stage name)."""
+
+    def __init__(self, name, help, label, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}  # label value -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, seconds):
+        i = bisect_left(self.buckets, seconds)
+        with self.lock:
+            row = self.series.get(value)
+            if row is None:
+                row = self.series[value] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {k: list(v) for k, v in self.series.items()}
+        for value, row in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row):
+                cumulative += count
+                labels = _labels((self.label, "le"), (value, _number(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels((self.label,), (value,))
+            lines.append(f"{self.name}_sum{labels} {row[-1]!r}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CounterFamily:
+    """Monotonic counters keyed by one label."""
+
+    def __init__(self, name, help, label):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = Counter()
+        self.lock = threading.Lock()
+
+    def inc(self, value, amount=1):
+        with self.lock:
+            self.values[value] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            values = dict(self.values)
+        for value, count in sorted(values.items()):
+            lines.append(f"{self.name}{_labels((self.label,), (value,))} {count}")
+        return lines
+
+
+class Callback:
+    """
+    A gauge or counter read at scrape time. fn returns a number, or a
+    {label value: number} dict when `label` is set; None skips the metric.
+    """
+
+    def __init__(self, name, help, kind, fn, label=None):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.fn = fn
+        self.label = label
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {e}")
+            return []
+        if value is None:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.label is None:
+            lines.append(f"{self.name} {_number(value)}")
+        else:
+            for key, v in sorted(value.items()):
+                lines.append(f"{self.name}{_labels((self.label,), (key,))} {_number(v)}")
+        return lines
+
+
+STAGES = Histogram(STAGE_METRIC, "Time spent in each stage of request handling.", "stage")
+EVENTS = CounterFamily("agrisaarthi_events_total", "Notable events (rejections, timeouts, lock errors).", "event")
+_families = [STAGES, EVENTS]
+
+# Observations made while call_recorded() runs are collected here instead
+_capture = threading.local()
+
+
+def observe(name, seconds):
+    """Record one stage duration in seconds."""
+    if not METRICS_ENABLED:
+        return
+    captured = getattr(_capture, "observations", None)
+    if captured is not None:
+        captured.append((name, seconds))
+    else:
+        STAGES.observe(name, seconds)
+
+
+class _StageTimer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+_NOOP = nullcontext()
+
+
+def stage(name):
+    """Context manager timing its body into the `name` stage."""
+    return _StageTimer(name) if METRICS_ENABLED else _NOOP
+
+
+def count(event, amount=1):
+    if METRICS_ENABLED:
+        EVENTS.inc(event, amount)
+
+
+def register_callback(name, help, fn, kind="gauge", label=None):
+    """Expose fn() as a gauge (or counter) evaluated at scrape time."""
+    _families.append(Callback(name, help, kind, fn, label))
+
+
+def call_recorded(fn, *args):
+    """
+    Run fn(*args) in a pool worker and return (result, observations), so
+    stage timings taken in another process can be merged by the caller.
+    """
+    if not METRICS_ENABLED:
+        return fn(*args), ()
+    _capture.observations = observations = []
+    try:
+        return fn(*args), observations
+    finally:
+        _capture.observations = None
+
+
+def merge(observations):
+    for name, seconds in observations:
+        STAGES.observe(name, seconds)
+
+
+def render():
+    """The whole registry in Prometheus text exposition format."""
+    lines = []
+    for family in _families:
+        lines.extend(family.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Per-request sampling profiler
+# ---------------------------------------------------------------------------
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread of this process at a fixed
+    interval and counts identical stacks. Other requests running at the same
+    time show up too; analysis-pool processes do not.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{Path(code.co_filename).stem}:{code.co_name}")
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def write(self, path, keep=PROFILE_MAX_FILES):
+        """Write the collapsed stacks, then delete all but the newest `keep` profiles."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        # Names start with a timestamp, so they sort oldest first
+        for old in sorted(path.parent.glob("*.folded"))[:-keep or None]:
+            old.unlink(missing_ok=True)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware profiling requests that carry `X-Profile: 1`."""
+
+    def __init__(self, app, directory=PROFILE_DIR, keep=PROFILE_MAX_FILES):
+        self.app = app
+        self.directory = Path(directory)
+        self.keep = max(1, keep)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (b"x-profile", b"1") not in scope["headers"]:
+            return await self.app(scope, receive, send)
+
+        from starlette.concurrency import run_in_threadpool
+
+        route = "".join(c if c.isalnum() else "_" for c in scope["path"].strip("/"))[:64] or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}-{route}.folded"
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                # Only the file name: the server's directory layout stays private
+                message["headers"] = [*message.get("headers", []), (b"x-profile", name.encode())]
+            await send(message)
+
+        with SamplingProfiler() as profiler:
+            await self.app(scope, receive, send_with_header)
+        await run_in_threadpool(profiler.write, self.directory / name, self.keep)
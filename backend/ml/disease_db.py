@@ -0,0 +1,126 @@
+"""
+disease_db.py
+-------------
+Multilingual disease knowledge base (EN / HI / TA / TE / ML) and the
+pre-rendered response fragments built from it.
+
+Pure Python, so the API, the history store and the benchmarks can use it
+without importing NumPy or PIL; only the classifier in disease_detector.py
+needs those.
+"""
+
+from types import MappingProxyType
+
+try:
+    import orjson
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:  # plain json is fine, just slower
+    import json
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+# ---------------------------------------------------------------------------
+# Multilingual disease knowledge base
+# ---------------------------------------------------------------------------
+DISEASE_DB = {
+    "Bacterial_Blight": {
+        "crop":        {"en": "Cotton",       "hi": "कपास",       "ta": "பருத்தி",      "te": "పత్తి",        "ml": "പരുത്തി"},
+        "disease":     {"en": "Bacterial Blight", "hi": "जीवाणु झुलसा", "ta": "பாக்டீரியல் கருகல்", "te": "బాక్టీరియల్ బ్లైట్", "ml": "ബാക്ടീരിയൽ ബ്ലൈറ്റ്"},
+        "remedy":      {"en": "Spray copper oxychloride 3g/L.", "hi": "कॉपर ऑक्सीक्लोराइड 3g/L छिड़कें।", "ta": "காப்பர் ஆக்சிகுளோரைடு 3g/L தெளிக்கவும்.", "te": "కాపర్ ఆక్సీక్లోరైడ్ 3g/L చల్లండి.", "ml": "കോപ്പർ ഓക്‌സിക്ലോറൈഡ് 3g/L തളിക്കുക."},
+        "precautions": {"en": "Remove infected leaves. Avoid overhead irrigation.", "hi": "संक्रमित पत्तियां हटाएं। ऊपरी सिंचाई से बचें।", "ta": "பாதிக்கப்பட்ட இலைகளை அகற்றவும். மேல்நோக்கிய நீர்ப்பாசனம் தவிர்க்கவும்.", "te": "సోకిన ఆకులు తొలగించండి. పైన నుండి నీరు పెట్టడం మానుకోండి.", "ml": "ബാധിത ഇലകൾ നീക്കം ചെയ്യുക. മുകളിൽ നിന്ന് നനവ് ഒഴിവാക്കുക."},
+    },
+    "Leaf_Rust": {
+        "crop":        {"en": "Wheat",        "hi": "गेहूं",       "ta": "கோதுமை",      "te": "గోధుమ",        "ml": "ഗോതമ്പ്"},
+        "disease":     {"en": "Leaf Rust",    "hi": "पत्ती रतुआ",  "ta": "இலை துரு",    "te": "ఆకు తుప్పు",   "ml": "ഇല തുരു"},
+        "remedy":      {"en": "Apply Mancozeb 2.5g/L or Propiconazole 1ml/L.", "hi": "मैनकोजेब 2.5g/L या प्रोपिकोनाजोल 1ml/L लगाएं।", "ta": "மான்கோஸெப் 2.5g/L அல்லது ப்ரோபிகோனசோல் 1ml/L தெளிக்கவும்.", "te": "మాంకోజెబ్ 2.5g/L లేదా ప్రోపికోనజోల్ 1ml/L వేయండి.", "ml": "മാൻകോസെബ് 2.5g/L അല്ലെങ്കിൽ പ്രോപിക്കോണസോൾ 1ml/L തളിക്കുക."},
+        "precautions": {"en": "Use resistant varieties. Avoid dense planting.", "hi": "प्रतिरोधी किस्में उपयोग करें। घनी बुवाई से बचें।", "ta": "எதிர்ப்பு திறன் கொண்ட ரகங்களைப் பயன்படுத்துங்கள். அடர்த்தியான நடவு தவிர்க்கவும்.", "te": "నిరోధక రకాలు వాడండి. దట్టంగా నాటడం మానుకోండి.", "ml": "പ്രതിരോധ ഇനങ്ങൾ ഉപയോഗിക്കുക. തിങ്ങി നടൽ ഒഴിവാക്കുക."},
+    },
+    "Early_Blight": {
+        "crop":        {"en": "Tomato",       "hi": "टमाटर",       "ta": "தக்காளி",     "te": "టమాటో",        "ml": "തക്കാളി"},
+        "disease":     {"en": "Early Blight", "hi": "अगेती झुलसा", "ta": "ஆரம்பகால கருகல்", "te": "ప్రారంభ తెగులు", "ml": "ആദ്യ ബ്ലൈറ്റ്"},
+        "remedy":      {"en": "Spray Chlorothalonil 2g/L every 10 days.", "hi": "क्लोरोथालोनिल 2g/L हर 10 दिन में छिड़कें।", "ta": "குளோரோதலோனில் 2g/L ஒவ்வொரு 10 நாட்களுக்கும் தெளிக்கவும்.", "te": "క్లోరోథాలోనిల్ 2g/L 10 రోజులకొకసారి చల్లండి.", "ml": "ക്ലോറോതലോണിൽ 2g/L 10 ദിവസം ഒരിക്കൽ തളിക്കുക."},
+        "precautions": {"en": "Ensure good air circulation. Remove lower leaves.", "hi": "अच्छी वायु संचार सुनिश्चित करें। निचली पत्तियां हटाएं।", "ta": "நல்ல காற்றோட்டம் உறுதி செய்யுங்கள். கீழ் இலைகளை அகற்றவும்.", "te": "మంచి గాలి ప్రసరణ నిర్ధారించండి. దిగువ ఆకులు తొలగించండి.", "ml": "നല്ല വായു ചംക്രമണം ഉറപ്പാക്കുക. താഴെ ഇലകൾ നീക്കം ചെയ്യുക."},
+    },
+    "Powdery_Mildew": {
+        "crop":        {"en": "Grapes",         "hi": "अंगूर",       "ta": "திராட்சை",    "te": "ద్రాక్ష",      "ml": "മുന്തിരി"},
+        "disease":     {"en": "Powdery Mildew", "hi": "पाउडरी फफूंदी", "ta": "பொடி பூஞ்சை", "te": "పొడి బూజు",   "ml": "പൊടി പൂപ്പൽ"},
+        "remedy":      {"en": "Apply wettable sulphur 3g/L or Karathane 1ml/L.", "hi": "गीली गंधक 3g/L या करेथेन 1ml/L लगाएं।", "ta": "ஈரமான கந்தகம் 3g/L அல்லது காரத்தேன் 1ml/L தெளிக்கவும்.", "te": "తడి సల్ఫర్ 3g/L లేదా కరాతేన్ 1ml/L వేయండి.", "ml": "നനഞ്ഞ സൾഫർ 3g/L അല്ലെങ്കിൽ കരാതേൻ 1ml/L തളിക്കുക."},
+        "precautions": {"en": "Prune overcrowded branches. Avoid excess nitrogen.", "hi": "भीड़ वाली शाखाओं को काटें। अतिरिक्त नाइट्रोजन से बचें।", "ta": "அடர்த்தியான கிளைகளை கத்தரிக்கவும். அதிக நைட்ரஜன் தவிர்க்கவும்.", "te": "దట్టమైన కొమ్మలు కత్తిరించండి. అధిక నత్రజని వాడకం తగ్గించండి.", "ml": "തിങ്ങിനിറഞ്ഞ ശാഖകൾ വെട്ടിമാറ്റുക. അധിക നൈട്രജൻ ഒഴിവാക്കുക."},
+    },
+    "Brown_Spot": {
+        "crop":        {"en": "Rice",        "hi": "चावल",        "ta": "அரிசி",       "te": "వరి",          "ml": "നെല്ല്"},
+        "disease":     {"en": "Brown Spot",  "hi": "भूरा धब्बा",  "ta": "பழுப்பு புள்ளி", "te": "గోధుమ మచ్చ", "ml": "തവിട്ട് പൊട്ട്"},
+        "remedy":      {"en": "Spray Edifenphos 1ml/L or Mancozeb 2g/L.", "hi": "एडिफेनफॉस 1ml/L या मैनकोजेब 2g/L छिड़कें।", "ta": "எடிஃபென்ஃபோஸ் 1ml/L அல்லது மான்கோஸெப் 2g/L தெளிக்கவும்.", "te": "ఎడిఫెన్‌ఫోస్ 1ml/L లేదా మాంకోజెబ్ 2g/L వేయండి.", "ml": "എഡിഫെൻഫോസ് 1ml/L അല്ലെങ്കിൽ മാൻകോസെബ് 2g/L തളിക്കുക."},
+        "precautions": {"en": "Use potassium fertilizer. Drain fields periodically.", "hi": "पोटेशियम उर्वरक उपयोग करें। खेतों में जल निकासी करें।", "ta": "பொட்டாசியம் உரம் பயன்படுத்துங்கள். வயல்களை அவ்வப்போது வடிகட்டவும்.", "te": "పొటాషియం ఎరువు వాడండి. పొలాలను క్రమం తప్పకుండా నీరు తీయండి.", "ml": "പൊട്ടാസ്യം വളം ഉപയോഗിക്കുക. പാടങ്ങൾ ഇടയ്ക്കിടെ വറ്റിക്കുക."},
+    },
+    "Healthy": {
+        "crop":        {"en": "Plant",    "hi": "पौधा",     "ta": "செடி",        "te": "మొక్క",        "ml": "ചെടി"},
+        "disease":     {"en": "Healthy",  "hi": "स्वस्थ",   "ta": "ஆரோக்கியமான", "te": "ఆరోగ్యకరమైన", "ml": "ആരോഗ്യകരം"},
+        "remedy":      {"en": "No treatment needed. Continue regular care.", "hi": "कोई उपचार आवश्यक नहीं। नियमित देखभाल जारी रखें।", "ta": "சிகிச்சை தேவையில்லை. வழக்கமான பராமரிப்பை தொடரவும்.", "te": "చికిత్స అవసరం లేదు. సాధారణ సంరక్షణ కొనసాగించండి.", "ml": "ചികിത്സ ആവശ്യമില്ല. പതിവ് പരിചരണം തുടരുക."},
+        "precautions": {"en": "Maintain regular watering and balanced fertilization.", "hi": "नियमित सिंचाई और संतुलित उर्वरक बनाए रखें।", "ta": "வழக்கமான நீர்ப்பாசனம் மற்றும் சமச்சீரான உரமிடல் பராமரிக்கவும்.", "te": "క్రమం తప్పకుండా నీరు మరియు సమతుల్య ఎరువులు వేయండి.", "ml": "പതിവ് നനവും സമതുലിത വളം നൽകലും നിലനിർത്തുക."},
+    },
+}
+
+DISEASE_KEYS = list(DISEASE_DB.keys())
+LANGS = ("en", "hi", "ta", "te", "ml")
+
+
+def build_result(key: str, conf: float) -> dict:
+    """Expand a disease key into the multilingual result dict."""
+    e = DISEASE_DB[key]
+
+    result = {
+        "key":         key,
+        "disease":     e["disease"]["en"],
+        "crop":        e["crop"]["en"],
+        "remedy":      e["remedy"]["en"],
+        "precautions": e["precautions"]["en"],
+        "confidence":  conf,
+        # English variants (used by save_disease_history)
+        "remedy_en":      e["remedy"]["en"],
+        "precautions_en": e["precautions"]["en"],
+    }
+
+    # All language variants
+    for lc in LANGS[1:]:
+        result[f"disease_{lc}"]     = e["disease"][lc]
+        result[f"crop_{lc}"]        = e["crop"][lc]
+        result[f"remedy_{lc}"]      = e["remedy"][lc]
+        result[f"precautions_{lc}"] = e["precautions"][lc]
+
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Pre-rendered API responses
+# ---------------------------------------------------------------------------
+def _render(key, lang):
+    e = DISEASE_DB[key]
+    members = dumps({
+        "disease":     e["disease"][lang].replace("_", " "),
+        "crop":        e["crop"][lang],
+        "remedy":      e["remedy"][lang],
+        "precautions": e["precautions"][lang],
+    })
+    return members[1:-1]  # drop the braces so callers can splice in more fields
+
+
+# (disease key, lang) -> serialized JSON members of the display fields,
+# built once at import and shared by every response.
+RESPONSE_TABLE = MappingProxyType({
+    (key, lc): _render(key, lc) for key in DISEASE_KEYS for lc in LANGS
+})
+
+
+def render_fields(key: str, lang: str) -> bytes:
+    """b'"disease":..,"crop":..,"remedy":..,"precautions":..' in lang (en fallback)."""
+    return RESPONSE_TABLE.get((key, lang)) or RESPONSE_TABLE[(key, "en")]
+
+
+def localized(key: str, field: str, lang: str) -> str:
+    """One text field of a disease entry, falling back to English."""
+    texts = DISEASE_DB[key][field]
+    return texts.get(lang, texts["en"])
@@ -2,82 +2,66 @@
 disease_detector.py
 -------------------
 Plant disease detector — no TensorFlow required.
-Uses PIL colour analysis to classify leaf images into one of 6 diseases,
-with a built-in multilingual knowledge base (EN / HI / TA / TE / ML).
+Uses PIL colour analysis to classify leaf images into one of 6 diseases.
+The multilingual knowledge base (EN / HI / TA / TE / ML) lives in
+disease_db.py, which the API imports without NumPy or PIL.
 
 Place this file in the REPO ROOT alongside app.py.
 """
 
 import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from PIL import Image
 
-# ---------------------------------------------------------------------------
-# Multilingual disease knowledge base
-# ---------------------------------------------------------------------------
-DISEASE_DB = {
-    "Bacterial_Blight": {
-        "crop":        {"en": "Cotton",       "hi": "कपास",       "ta": "பருத்தி",      "te": "పత్తి",        "ml": "പരുത്തി"},
-        "disease":     {"en": "Bacterial Blight", "hi": "जीवाणु झुलसा", "ta": "பாக்டீரியல் கருகல்", "te": "బాక్టీరియల్ బ్లైట్", "ml": "ബാക്ടീരിയൽ ബ്ലൈറ്റ്"},
-        "remedy":      {"en": "Spray copper oxychloride 3g/L.", "hi": "कॉपर ऑक्सीक्लोराइड 3g/L छिड़कें।", "ta": "காப்பர் ஆக்சிகுளோரைடு 3g/L தெளிக்கவும்.", "te": "కాపర్ ఆక్సీక్లోరైడ్ 3g/L చల్లండి.", "ml": "കോപ്പർ ഓക്‌സിക്ലോറൈഡ് 3g/L തളിക്കുക."},
-        "precautions": {"en": "Remove infected leaves. Avoid overhead irrigation.", "hi": "संक्रमित पत्तियां हटाएं। ऊपरी सिंचाई से बचें।", "ta": "பாதிக்கப்பட்ட இலைகளை அகற்றவும். மேல்நோக்கிய நீர்ப்பாசனம் தவிர்க்கவும்.", "te": "సోకిన ఆకులు తొలగించండి. పైన నుండి నీరు పెట్టడం మానుకోండి.", "ml": "ബാധിത ഇലകൾ നീക്കം ചെയ്യുക. മുകളിൽ നിന്ന് നനവ് ഒഴിവാക്കുക."},
-    },
-    "Leaf_Rust": {
-        "crop":        {"en": "Wheat",        "hi": "गेहूं",       "ta": "கோதுமை",      "te": "గోధుమ",        "ml": "ഗോതമ്പ്"},
-        "disease":     {"en": "Leaf Rust",    "hi": "पत्ती रतुआ",  "ta": "இலை துரு",    "te": "ఆకు తుప్పు",   "ml": "ഇല തുരു"},
-        "remedy":      {"en": "Apply Mancozeb 2.5g/L or Propiconazole 1ml/L.", "hi": "मैनकोजेब 2.5g/L या प्रोपिकोनाजोल 1ml/L लगाएं।", "ta": "மான்கோஸெப் 2.5g/L அல்லது ப்ரோபிகோனசோல் 1ml/L தெளிக்கவும்.", "te": "మాంకోజెబ్ 2.5g/L లేదా ప్రోపికోనజోల్ 1ml/L వేయండి.", "ml": "മാൻകോസെബ് 2.5g/L അല്ലെങ്കിൽ പ്രോപിക്കോണസോൾ 1ml/L തളിക്കുക."},
-        "precautions": {"en": "Use resistant varieties. Avoid dense planting.", "hi": "प्रतिरोधी किस्में उपयोग करें। घनी बुवाई से बचें।", "ta": "எதிர்ப்பு திறன் கொண்ட ரகங்களைப் பயன்படுத்துங்கள். அடர்த்தியான நடவு தவிர்க்கவும்.", "te": "నిరోధక రకాలు వాడండి. దట్టంగా నాటడం మానుకోండి.", "ml": "പ്രതിരോധ ഇനങ്ങൾ ഉപയോഗിക്കുക. തിങ്ങി നടൽ ഒഴിവാക്കുക."},
-    },
-    "Early_Blight": {
-        "crop":        {"en": "Tomato",       "hi": "टमाटर",       "ta": "தக்காளி",     "te": "టమాటో",        "ml": "തക്കാളി"},
-        "disease":     {"en": "Early Blight", "hi": "अगेती झुलसा", "ta": "ஆரம்பகால கருகல்", "te": "ప్రారంభ తెగులు", "ml": "ആദ്യ ബ്ലൈറ്റ്"},
-        "remedy":      {"en": "Spray Chlorothalonil 2g/L every 10 days.", "hi": "क्लोरोथालोनिल 2g/L हर 10 दिन में छिड़कें।", "ta": "குளோரோதலோனில் 2g/L ஒவ்வொரு 10 நாட்களுக்கும் தெளிக்கவும்.", "te": "క్లోరోథాలోనిల్ 2g/L 10 రోజులకొకసారి చల్లండి.", "ml": "ക്ലോറോതലോണിൽ 2g/L 10 ദിവസം ഒരിക്കൽ തളിക്കുക."},
-        "precautions": {"en": "Ensure good air circulation. Remove lower leaves.", "hi": "अच्छी वायु संचार सुनिश्चित करें। निचली पत्तियां हटाएं।", "ta": "நல்ல காற்றோட்டம் உறுதி செய்யுங்கள். கீழ் இலைகளை அகற்றவும்.", "te": "మంచి గాలి ప్రసరణ నిర్ధారించండి. దిగువ ఆకులు తొలగించండి.", "ml": "നല്ല വായു ചംക്രമണം ഉറപ്പാക്കുക. താഴെ ഇലകൾ നീക്കം ചെയ്യുക."},
-    },
-    "Powdery_Mildew": {
-        "crop":        {"en": "Grapes",         "hi": "अंगूर",       "ta": "திராட்சை",    "te": "ద్రాక్ష",      "ml": "മുന്തിരി"},
-        "disease":     {"en": "Powdery Mildew", "hi": "पाउडरी फफूंदी", "ta": "பொடி பூஞ்சை", "te": "పొడి బూజు",   "ml": "പൊടി പൂപ്പൽ"},
-        "remedy":      {"en": "Apply wettable sulphur 3g/L or Karathane 1ml/L.", "hi": "गीली गंधक 3g/L या करेथेन 1ml/L लगाएं।", "ta": "ஈரமான கந்தகம் 3g/L அல்லது காரத்தேன் 1ml/L தெளிக்கவும்.", "te": "తడి సల్ఫర్ 3g/L లేదా కరాతేన్ 1ml/L వేయండి.", "ml": "നനഞ്ഞ സൾഫർ 3g/L അല്ലെങ്കിൽ കരാതേൻ 1ml/L തളിക്കുക."},
-        "precautions": {"en": "Prune overcrowded branches. Avoid excess nitrogen.", "hi": "भीड़ वाली शाखाओं को काटें। अतिरिक्त नाइट्रोजन से बचें।", "ta": "அடர்த்தியான கிளைகளை கத்தரிக்கவும். அதிக நைட்ரஜன் தவிர்க்கவும்.", "te": "దట్టమైన కొమ్మలు కత్తిరించండి. అధిక నత్రజని వాడకం తగ్గించండి.", "ml": "തിങ്ങിനിറഞ്ഞ ശാഖകൾ വെട്ടിമാറ്റുക. അധിക നൈട്രജൻ ഒഴിവാക്കുക."},
-    },
-    "Brown_Spot": {
-        "crop":        {"en": "Rice",        "hi": "चावल",        "ta": "அரிசி",       "te": "వరి",          "ml": "നെല്ല്"},
-        "disease":     {"en": "Brown Spot",  "hi": "भूरा धब्बा",  "ta": "பழுப்பு புள்ளி", "te": "గోధుమ మచ్చ", "ml": "തവിട്ട് പൊട്ട്"},
-        "remedy":      {"en": "Spray Edifenphos 1ml/L or Mancozeb 2g/L.", "hi": "एडिफेनफॉस 1ml/L या मैनकोजेब 2g/L छिड़कें।", "ta": "எடிஃபென்ஃபோஸ் 1ml/L அல்லது மான்கோஸெப் 2g/L தெளிக்கவும்.", "te": "ఎడిఫెన్‌ఫోస్ 1ml/L లేదా మాంకోజెబ్ 2g/L వేయండి.", "ml": "എഡിഫെൻഫോസ് 1ml/L അല്ലെങ്കിൽ മാൻകോസെബ് 2g/L തളിക്കുക."},
-        "precautions": {"en": "Use potassium fertilizer. Drain fields periodically.", "hi": "पोटेशियम उर्वरक उपयोग करें। खेतों में जल निकासी करें।", "ta": "பொட்டாசியம் உரம் பயன்படுத்துங்கள். வயல்களை அவ்வப்போது வடிகட்டவும்.", "te": "పొటాషియం ఎరువు వాడండి. పొలాలను క్రమం తప్పకుండా నీరు తీయండి.", "ml": "പൊട്ടാസ്യം വളം ഉപയോഗിക്കുക. പാടങ്ങൾ ഇടയ്ക്കിടെ വറ്റിക്കുക."},
-    },
-    "Healthy": {
-        "crop":        {"en": "Plant",    "hi": "पौधा",     "ta": "செடி",        "te": "మొక్క",        "ml": "ചെടി"},
-        "disease":     {"en": "Healthy",  "hi": "स्वस्थ",   "ta": "ஆரோக்கியமான", "te": "ఆరోగ్యకరమైన", "ml": "ആരോഗ്യകരം"},
-        "remedy":      {"en": "No treatment needed. Continue regular care.", "hi": "कोई उपचार आवश्यक नहीं। नियमित देखभाल जारी रखें।", "ta": "சிகிச்சை தேவையில்லை. வழக்கமான பராமரிப்பை தொடரவும்.", "te": "చికిత్స అవసరం లేదు. సాధారణ సంరక్షణ కొనసాగించండి.", "ml": "ചികിത്സ ആവശ്യമില്ല. പതിവ് പരിചരണം തുടരുക."},
-        "precautions": {"en": "Maintain regular watering and balanced fertilization.", "hi": "नियमित सिंचाई और संतुलित उर्वरक बनाए रखें।", "ta": "வழக்கமான நீர்ப்பாசனம் மற்றும் சமச்சீரான உரமிடல் பராமரிக்கவும்.", "te": "క్రమం తప్పకుండా నీరు మరియు సమతుల్య ఎరువులు వేయండి.", "ml": "പതിവ് നനവും സമതുലിത വളം നൽകലും നിലനിർത്തുക."},
-    },
-}
-
-DISEASE_KEYS = list(DISEASE_DB.keys())
-
-
-def predict_disease(img_path: str, lang: str = "en") -> dict:
+from metrics import stage
+# Re-exported so existing `from ml.disease_detector import ...` callers keep working
+from ml.disease_db import (  # noqa: F401
+    DISEASE_DB, DISEASE_KEYS, LANGS, RESPONSE_TABLE, build_result, dumps, localized, render_fields,
+)
+
+# Model input size; uploads are reduced to this before any feature math.
+IMG_SIZE = (128, 128)
+# Decoder threads per predict_disease_batch call.
+DECODE_THREADS = min(8, os.cpu_count() or 1)
+# Salts every prediction-cache key (see prediction_cache.py). Bump it with any
+# change that can give the same image a different label, so labels cached by
+# the old classifier, including in PREDICTION_CACHE_DB, stop matching.
+CLASSIFIER_VERSION = "2"
+
+
+def load_leaf_array(source) -> np.ndarray:
     """
-    Predict plant disease from a leaf image using PIL colour analysis.
-    No TensorFlow or external model file required.
+    Decode a leaf image to a 128x128x3 uint8 array without touching disk.
 
-    Args:
-        img_path: Path to the leaf image (jpg/png).
-        lang:     Language code — 'en', 'hi', 'ta', 'te', or 'ml'.
+    JPEGs are opened in draft mode so libjpeg downscales by 1/2..1/8 while
+    decoding; other formats are shrunk with Image.reduce() before the final
+    resize. A 12 MP phone photo never gets decoded at full resolution.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with Image.open(source) as img:
+        img.draft("RGB", IMG_SIZE)
+        img = img.convert("RGB").resize(IMG_SIZE, reducing_gap=2.0)
+        return np.asarray(img, dtype=np.uint8)
 
-    Returns:
-        dict with keys: disease, crop, remedy, precautions, confidence
-        + *_hi / *_ta / *_te / *_ml variants for all text fields.
+
+def classify_leaf_batch(batch: np.ndarray) -> list:
     """
-    try:
-        img = Image.open(img_path).convert("RGB").resize((128, 128))
-        arr = np.array(img, dtype=float)
+    Classify a stacked (N, 128, 128, 3) uint8 tensor of leaves.
 
-        r = arr[:, :, 0].mean()
-        g = arr[:, :, 1].mean()
-        b = arr[:, :, 2].mean()
+    Channel means for the whole batch come from one reduction; the content
+    hash is still per image, taken over each contiguous slice of the tensor.
+    Returns one (disease key, confidence) pair per image.
+    """
+    batch = np.ascontiguousarray(batch, dtype=np.uint8)
+    means = batch.reshape(len(batch), -1, 3).mean(axis=1, dtype=np.float32)
 
+    out = []
+    for arr, (r, g, b) in zip(batch, means.tolist()):
         # Stable index derived from image content (deterministic, not random)
         img_hash = int(hashlib.md5(arr.tobytes()).hexdigest(), 16)
 
@@ -96,32 +80,73 @@ def predict_disease(img_path: str, lang: str = "en") -> dict:
             key  = DISEASE_KEYS[img_hash % len(DISEASE_KEYS)]
             conf = 0.60 + (img_hash % 30) / 100
 
-        conf = round(min(conf, 0.97), 4)
+        out.append((key, round(min(conf, 0.97), 4)))
+    return out
+
+
+# Fallback for images that cannot be decoded
+UNREADABLE = ("Healthy", 0.50)
 
+
+def classify_leaf(source) -> tuple:
+    """(disease key, confidence) for one leaf image; the cheap path for the API."""
+    try:
+        with stage("image_decode"):
+            arr = load_leaf_array(source)
+        with stage("colour_analysis"):
+            return classify_leaf_batch(arr[None])[0]
     except Exception:
-        key, conf = "Healthy", 0.50
+        return UNREADABLE
 
-    e = DISEASE_DB[key]
 
-    result = {
-        "disease":     e["disease"]["en"],
-        "crop":        e["crop"]["en"],
-        "remedy":      e["remedy"]["en"],
-        "precautions": e["precautions"]["en"],
-        "confidence":  conf,
-        # English variants (used by save_disease_history)
-        "remedy_en":      e["remedy"]["en"],
-        "precautions_en": e["precautions"]["en"],
-    }
+def predict_disease(source, lang: str = "en") -> dict:
+    """
+    Predict plant disease from a leaf image using PIL colour analysis.
+    No TensorFlow or external model file required.
 
-    # All language variants
-    for lc in ("hi", "ta", "te", "ml"):
-        result[f"disease_{lc}"]     = e["disease"][lc]
-        result[f"crop_{lc}"]        = e["crop"][lc]
-        result[f"remedy_{lc}"]      = e["remedy"][lc]
-        result[f"precautions_{lc}"] = e["precautions"][lc]
+    Args:
+        source: Leaf image (jpg/png) as a path, raw bytes or a file-like object.
+        lang:   Language code — 'en', 'hi', 'ta', 'te', or 'ml'.
+
+    Returns:
+        dict with keys: key, disease, crop, remedy, precautions, confidence
+        + *_hi / *_ta / *_te / *_ml variants for all text fields.
+    """
+    return build_result(*classify_leaf(source))
 
-    return result
 
+def _try_load(source):
+    try:
+        return load_leaf_array(source)
+    except Exception:
+        return None
 
 
+def classify_leaves(sources) -> list:
+    """
+    (disease key, confidence) for many leaf images, in input order.
+
+    Images are decoded concurrently (PIL releases the GIL while decoding),
+    stacked into one tensor and classified together. Unreadable images get
+    the same fallback as predict_disease.
+    """
+    sources = list(sources)
+    if not sources:
+        return []
+    with stage("image_decode_batch"), \
+            ThreadPoolExecutor(max_workers=min(len(sources), DECODE_THREADS)) as pool:
+        arrays = list(pool.map(_try_load, sources))
+
+    ok = [i for i, a in enumerate(arrays) if a is not None]
+    labels = [UNREADABLE] * len(sources)
+    if ok:
+        with stage("colour_analysis_batch"):
+            fresh = classify_leaf_batch(np.stack([arrays[i] for i in ok]))
+        for i, label in zip(ok, fresh):
+            labels[i] = label
+    return labels
+
+
+def predict_disease_batch(sources, lang: str = "en") -> list:
+    """predict_disease for many images; see classify_leaves."""
+    return [build_result(key, conf) for key, conf in classify_leaves(sources)]
@@ -0,0 +1,190 @@
+"""
+prediction_cache.py
+-------------------
+Content-addressed cache of disease predictions.
+
+predict_disease is deterministic for a given image, so the (disease key,
+confidence) label is cached under a BLAKE2 digest of the raw upload bytes,
+salted with the detector's CLASSIFIER_VERSION, and a repeated upload skips
+decode and analysis entirely. The in-memory
+tier is a bounded LRU of PREDICTION_CACHE_SIZE entries. Setting
+PREDICTION_CACHE_DB adds a SQLite tier that survives restarts.
+"""
+
+import ast
+import hashlib
+import importlib.util
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import metrics
+
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 1024))
+PREDICTION_CACHE_DB = os.environ.get("PREDICTION_CACHE_DB", "")
+
+CACHE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS prediction_cache (
+        digest TEXT PRIMARY KEY,
+        disease_key TEXT NOT NULL,
+        confidence REAL NOT NULL
+    )
+"""
+
+
+def classifier_version():
+    """
+    CLASSIFIER_VERSION from ml/disease_detector.py, read from its source:
+    importing the detector would load NumPy and PIL into the API process.
+    """
+    source = Path(importlib.util.find_spec("ml.disease_detector").origin).read_text(encoding="utf-8")
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "CLASSIFIER_VERSION" for t in node.targets):
+            return str(ast.literal_eval(node.value))
+    raise RuntimeError("ml/disease_detector.py does not define CLASSIFIER_VERSION")
+
+
+# BLAKE2 salts are at most 16 bytes
+DIGEST_SALT = classifier_version().encode()[:16]
+
+
+def content_digest(content):
+    # hashlib drops the GIL for large buffers, so callers hash in a threadpool
+    return hashlib.blake2b(content, digest_size=16, salt=DIGEST_SALT).hexdigest()
+
+
+class PredictionCache:
+    """
+    digest -> (disease key, confidence). Safe to use from several threads.
+
+    `lock` guards the LRU and counters only; the SQLite tier has its own
+    `disk_lock`, so memory hits never wait behind a disk read or write.
+    """
+
+    def __init__(self, maxsize=PREDICTION_CACHE_SIZE, path=PREDICTION_CACHE_DB):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.disk_lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(CACHE_SCHEMA)
+            self.conn.commit()
+
+    def _remember(self, digest, label):
+        self.entries[digest] = label
+        self.entries.move_to_end(digest)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def _disk_get(self, digest):
+        with self.disk_lock:
+            if self.conn is None:
+                return None
+            return self.conn.execute(
+                "SELECT disease_key, confidence FROM prediction_cache WHERE digest = ?", (digest,)
+            ).fetchone()
+
+    def get(self, digest):
+        with self.lock:
+            label = self.entries.get(digest)
+            if label is not None:
+                self.entries.move_to_end(digest)
+                self.hits += 1
+                return label
+            if self.conn is None:
+                self.misses += 1
+                return None
+
+        row = self._disk_get(digest)
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            label = (row[0], row[1])
+            self._remember(digest, label)
+            self.disk_hits += 1
+            return label
+
+    def put(self, digest, label):
+        self.put_many([(digest, label)])
+
+    def put_many(self, items):
+        with self.lock:
+            for digest, label in items:
+                self._remember(digest, tuple(label))
+        with self.disk_lock:
+            if self.conn is not None and items:
+                try:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO prediction_cache (digest, disease_key, confidence) VALUES (?, ?, ?)",
+                        [(digest, key, conf) for digest, (key, conf) in items],
+                    )
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    self.conn.rollback()
+                    print(f"Error writing prediction cache: {e}")
+
+    def lookup(self, contents):
+        """Digest each upload and return [(digest, label or None)] in order."""
+        with metrics.stage("cache_lookup"):
+            digests = [content_digest(c) for c in contents]
+            return [(d, self.get(d)) for d in digests]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk": self.conn is not None,
+            }
+
+    def close(self):
+        with self.disk_lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PredictionCache()
+    return _cache
+
+
+def close_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+
+
+def _lookup_counts():
+    if _cache is None:
+        return None
+    stats = _cache.stats()
+    return {"hit": stats["hits"], "disk_hit": stats["disk_hits"], "miss": stats["misses"]}
+
+
+metrics.register_callback(
+    "agrisaarthi_prediction_cache_lookups_total", "Prediction cache lookups by outcome.",
+    _lookup_counts, kind="counter", label="result")
+metrics.register_callback(
+    "agrisaarthi_prediction_cache_entries", "Predictions held in the in-memory tier.",
+    lambda: len(_cache.entries) if _cache is not None else None)
@@ -0,0 +1,280 @@
+"""
+sensors.py
+----------
+Ingestion and rolling aggregates for IoT field sensors.
+
+Readings are appended in batches to a WITHOUT ROWID SQLite table clustered
+on (device_id, ts), so a device's time range is one contiguous range scan
+with every column in the same b-tree. Each device also keeps in-memory
+1h and 24h windows per metric that are updated in amortized O(1) per reading: a
+running sum for the mean and monotonic deques for min/max. Aggregate
+queries read those windows and never rescan raw rows.
+
+The table is the source of truth; the windows are a per-process cache of
+it. The sensor_devices table records each device's newest reading and a
+revision, both written in the ingest transaction. An aggregate query
+compares the cached windows with that row: it pushes only the readings
+stored since (by whichever worker process took them), and rebuilds the
+device's windows from its last 24h when a late reading has bumped the
+revision. Every worker, before and after a restart, therefore reports
+the same aggregates for the same stored readings.
+
+Windows are in event time: a device's window ends at its newest reading.
+Every reading expires old values from all of the device's metric windows,
+including metrics it carries no value for. Non-finite values (NaN, inf)
+are never added, as they would poison the running sums.
+"""
+
+import datetime
+import itertools
+import math
+import threading
+from collections import deque
+
+import db_handler
+import metrics
+from db_handler import begin_write, get_connection
+
+METRICS = ("temperature", "humidity", "soil_moisture")
+WINDOWS = {"1h": 3600, "24h": 86400}
+MAX_READINGS_PER_BATCH = 5000
+
+SENSOR_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sensor_readings (
+        device_id TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        temperature REAL,
+        humidity REAL,
+        soil_moisture REAL,
+        PRIMARY KEY (device_id, ts)
+    ) WITHOUT ROWID
+"""
+
+# One row per device: its newest reading, and a revision bumped whenever a
+# late reading lands inside its windows, so every process rebuilds them.
+SENSOR_DEVICES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sensor_devices (
+        device_id TEXT PRIMARY KEY,
+        last_ts INTEGER NOT NULL,
+        revision INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+UPSERT_DEVICE_SQL = """
+    INSERT INTO sensor_devices (device_id, last_ts, revision) VALUES (?, ?, ?)
+    ON CONFLICT (device_id) DO UPDATE SET
+        last_ts = excluded.last_ts, revision = revision + excluded.revision
+"""
+
+INSERT_READING_SQL = """
+    INSERT OR REPLACE INTO sensor_readings (device_id, ts, temperature, humidity, soil_moisture)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+
+def to_epoch(value):
+    """datetime (naive = UTC) or epoch number -> integer epoch seconds."""
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return int(value.timestamp())
+    return int(value)
+
+
+def to_iso(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat()
+
+
+class RollingWindow:
+    """min/max/mean of the values in (newest - span, newest], amortized O(1) per push."""
+
+    def __init__(self, span):
+        self.span = span
+        self.values = deque()   # (ts, value)
+        self.mins = deque()     # increasing values, candidates for the minimum
+        self.maxs = deque()     # decreasing values, candidates for the maximum
+        self.total = 0.0
+
+    def push(self, ts, value):
+        """Add a value; call expire(ts) afterwards to drop what fell out."""
+        self.values.append((ts, value))
+        self.total += value
+        while self.mins and self.mins[-1][1] > value:
+            self.mins.pop()
+        self.mins.append((ts, value))
+        while self.maxs and self.maxs[-1][1] < value:
+            self.maxs.pop()
+        self.maxs.append((ts, value))
+
+    def expire(self, ts):
+        """Drop values outside (ts - span, ts]."""
+        cutoff = ts - self.span
+        while self.values and self.values[0][0] <= cutoff:
+            self.total -= self.values.popleft()[1]
+        while self.mins and self.mins[0][0] <= cutoff:
+            self.mins.popleft()
+        while self.maxs and self.maxs[0][0] <= cutoff:
+            self.maxs.popleft()
+        if not self.values:
+            self.total = 0.0  # no float drift carried into the next value
+
+    def stats(self):
+        if not self.values:
+            return {"count": 0, "min": None, "max": None, "mean": None}
+        return {
+            "count": len(self.values),
+            "min": self.mins[0][1],
+            "max": self.maxs[0][1],
+            "mean": round(self.total / len(self.values), 4),
+        }
+
+
+class DeviceWindows:
+    def __init__(self):
+        self.last_ts = None
+        self.revision = 0  # sensor_devices.revision these windows were built at
+        self.windows = {
+            name: {metric: RollingWindow(span) for metric in METRICS}
+            for name, span in WINDOWS.items()
+        }
+
+    def push(self, ts, values):
+        """Add one reading; returns False for late or duplicate readings."""
+        if self.last_ts is not None and ts <= self.last_ts:
+            return False
+        self.last_ts = ts
+        for by_metric in self.windows.values():
+            for metric, value in zip(METRICS, values):
+                if value is not None and math.isfinite(value):
+                    by_metric[metric].push(ts, float(value))
+            for window in by_metric.values():
+                window.expire(ts)
+        return True
+
+    def stats(self):
+        return {
+            name: {metric: window.stats() for metric, window in by_metric.items()}
+            for name, by_metric in self.windows.items()
+        }
+
+
+class SensorStore:
+    """
+    The reading table, the sensor_devices table and this process's windows.
+
+    Windows are a cache of the table: aggregates() compares a device's
+    windows with its sensor_devices row and catches up on readings stored
+    since (by any worker process), or rebuilds them after a late reading.
+    """
+
+    def __init__(self):
+        self.devices = {}
+        self.lock = threading.Lock()
+        self._schema_path = None
+
+    def _ensure_schema(self, conn):
+        if self._schema_path == db_handler.DB_PATH:
+            return
+        created = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sensor_devices'"
+        ).fetchone() is None
+        conn.execute(SENSOR_SCHEMA)
+        conn.execute(SENSOR_DEVICES_SCHEMA)
+        if created:
+            # Tables written before sensor_devices existed
+            conn.execute(
+                "INSERT OR IGNORE INTO sensor_devices (device_id, last_ts, revision)"
+                " SELECT device_id, MAX(ts), 0 FROM sensor_readings GROUP BY device_id"
+            )
+        conn.commit()
+        self._schema_path = db_handler.DB_PATH
+
+    def ingest(self, readings):
+        """
+        Store (device_id, ts, temperature, humidity, soil_moisture) tuples and
+        advance each device's sensor_devices row in one transaction. Returns
+        (stored, late); late readings are at or before the device's newest.
+        """
+        rows = sorted(readings, key=lambda r: (r[0], r[1]))
+        conn = get_connection()
+        with self.lock:
+            self._ensure_schema(conn)
+        late = 0
+        try:
+            begin_write(conn)
+            with metrics.stage("sensor_insert"):
+                conn.executemany(INSERT_READING_SQL, rows)
+                for device_id, group in itertools.groupby(rows, key=lambda r: r[0]):
+                    stamps = [r[1] for r in group]
+                    found = conn.execute(
+                        "SELECT last_ts FROM sensor_devices WHERE device_id = ?", (device_id,)
+                    ).fetchone()
+                    newest = found[0] if found else None
+                    changed = False  # a late reading inside the device's windows
+                    for ts in stamps:
+                        if newest is not None and ts <= newest:
+                            late += 1
+                            changed = changed or ts > newest - max(WINDOWS.values())
+                        else:
+                            newest = ts
+                    conn.execute(UPSERT_DEVICE_SQL, (device_id, newest, int(changed)))
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return len(rows), late
+
+    def _sync(self, conn, device_id, last_ts, revision):
+        """Bring the device's windows up to (last_ts, revision) from the table."""
+        device = self.devices.get(device_id)
+        if device is None or device.revision != revision:
+            device = self.devices[device_id] = DeviceWindows()
+            device.revision = revision
+            since = last_ts - max(WINDOWS.values())
+        elif device.last_ts < last_ts:
+            since = device.last_ts
+        else:
+            return device
+        rows = conn.execute(
+            "SELECT ts, temperature, humidity, soil_moisture FROM sensor_readings"
+            " WHERE device_id = ? AND ts > ? AND ts <= ? ORDER BY ts",
+            (device_id, since, last_ts),
+        )
+        for ts, *values in rows:
+            device.push(ts, values)
+        return device
+
+    def aggregates(self, device_id):
+        conn = get_connection()
+        with self.lock:
+            self._ensure_schema(conn)
+            found = conn.execute(
+                "SELECT last_ts, revision FROM sensor_devices WHERE device_id = ?", (device_id,)
+            ).fetchone()
+            if found is None:
+                return None
+            with metrics.stage("sensor_sync"):
+                device = self._sync(conn, device_id, *found)
+            return {"last_ts": to_iso(device.last_ts), "windows": device.stats()}
+
+    def readings(self, device_id, start=None, end=None, limit=1000):
+        """Raw readings of one device in [start, end), oldest first."""
+        with self.lock:
+            self._ensure_schema(get_connection())
+        query = "SELECT ts, temperature, humidity, soil_moisture FROM sensor_readings WHERE device_id = ?"
+        params = [device_id]
+        if start is not None:
+            query += " AND ts >= ?"
+            params.append(to_epoch(start))
+        if end is not None:
+            query += " AND ts < ?"
+            params.append(to_epoch(end))
+        query += " ORDER BY ts LIMIT ?"
+        params.append(limit)
+        return [
+            {"timestamp": to_iso(ts), **dict(zip(METRICS, values))}
+            for ts, *values in get_connection().execute(query, params)
+        ]
+
+
+store = SensorStore()
@@ -0,0 +1,49 @@
+import datasets
+from datasets import DatasetRegistry, DatasetSnapshot
+
+
+def make_registry(tmp_path):
+    paths = {"crops": tmp_path / "crops.csv", "prices": tmp_path / "prices.csv"}
+    for path in paths.values():
+        path.write_text("crop\n")
+    return DatasetRegistry(paths=paths, interval=3600)
+
+
+def test_failed_first_load_is_retried(tmp_path, monkeypatch):
+    calls = []
+
+    def build(paths, version, files):
+        calls.append(version)
+        if len(calls) < 3:
+            raise PermissionError("not readable yet")
+        return DatasetSnapshot(crops=[{"crop": "Wheat"}], version=version, files=files, loaded_at=1.0)
+
+    monkeypatch.setattr(datasets, "build_snapshot", build)
+    registry = make_registry(tmp_path)
+
+    assert registry.current.crops == []
+    assert registry.reload() is False
+    assert registry.reload() is True
+    assert len(calls) == 3
+    assert registry.current.crops == [{"crop": "Wheat"}]
+    assert registry.last_error is None
+
+
+def test_failed_rebuild_keeps_snapshot_without_retrying(tmp_path, monkeypatch):
+    registry = make_registry(tmp_path)
+    monkeypatch.setattr(datasets, "build_snapshot", lambda paths, version, files: DatasetSnapshot(
+        crops=[{"crop": "Wheat"}], version=version, files=files, loaded_at=1.0))
+    good = registry.current
+
+    calls = []
+
+    def broken(paths, version, files):
+        calls.append(version)
+        raise ValueError("bad csv")
+
+    monkeypatch.setattr(datasets, "build_snapshot", broken)
+    (tmp_path / "crops.csv").write_text("crop\nbroken\n")
+    assert registry.reload() is False
+    assert registry.reload() is False
+    assert len(calls) == 1
+    assert registry.current is good
@@ -0,0 +1,51 @@
+import db_handler
+
+ROW = ("farmer", "Wheat", "Leaf Rust", "Leaf_Rust", "en")
+
+
+def test_writer_survives_a_failed_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_handler, "DB_PATH", str(tmp_path / "history.db"))
+    real_init = db_handler.init_db
+    failures = []
+
+    def flaky_init():
+        if not failures:
+            failures.append(1)
+            raise RuntimeError("disk went away")
+        real_init()
+
+    monkeypatch.setattr(db_handler, "init_db", flaky_init)
+    writer = db_handler.HistoryWriter()
+    try:
+        writer.submit([ROW])
+        writer.flush()
+        writer.submit([ROW, ROW])
+        writer.flush()
+        assert writer.thread.is_alive()
+    finally:
+        writer.stop()
+
+    count = db_handler.get_connection().execute("SELECT COUNT(*) FROM disease_history").fetchone()[0]
+    assert failures and count == 2
+
+
+def test_history_filters_match_every_language(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_handler, "DB_PATH", str(tmp_path / "history.db"))
+    db_handler.init_db()
+    conn = db_handler.get_connection()
+    conn.executemany(db_handler.INSERT_SQL, [
+        ("a", "Wheat", "Leaf Rust", "Leaf_Rust", "en"),
+        ("b", "गेहूं", "पत्ती रतुआ", "Leaf_Rust", "hi"),
+        ("c", "Tomato", "Early Blight", "Early_Blight", "en"),
+    ])
+    conn.commit()
+
+    def farmers(**filters):
+        history, _ = db_handler.get_disease_history(**filters)
+        return sorted(item["farmer_name"] for item in history)
+
+    assert farmers(disease="Leaf Rust") == ["a", "b"]
+    assert farmers(disease="Leaf_Rust") == ["a", "b"]
+    assert farmers(disease="पत्ती रतुआ") == ["a", "b"]
+    assert farmers(crop="Wheat") == ["a", "b"]
+    assert farmers(crop="Wheat", disease="Early Blight") == []
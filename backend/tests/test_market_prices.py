@@ -0,0 +1,30 @@
+import shutil
+from pathlib import Path
+
+from market_prices import cache_path_for, load_market_prices
+
+DATA = Path(__file__).resolve().parent.parent / "data"
+CROPS = ["Wheat", "Rice", "Maize", "Coconut"]
+
+
+def feed_copy(tmp_path):
+    path = tmp_path / "market_prices.csv"
+    shutil.copy(DATA / "market_prices.csv", path)
+    return path
+
+
+def test_truncated_cache_is_rebuilt(tmp_path):
+    path = feed_copy(tmp_path)
+    expected = load_market_prices(path, CROPS).national_prices()
+    cache = cache_path_for(path)
+    cache.write_bytes(cache.read_bytes()[:200])
+
+    assert load_market_prices(path, CROPS).national_prices() == expected
+    assert load_market_prices(path, CROPS).national_prices() == expected  # from the rewritten cache
+    assert expected["Wheat"] > 0
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == ".tmp"] == []
+
+
+def test_coconut_is_priced_per_nut(tmp_path):
+    prices = load_market_prices(feed_copy(tmp_path), CROPS).national_prices()
+    assert 1 < prices["Coconut"] < 50
@@ -0,0 +1,10 @@
+import prediction_cache
+from ml import disease_detector
+
+
+def test_digest_is_salted_with_the_classifier_version(monkeypatch):
+    assert prediction_cache.classifier_version() == disease_detector.CLASSIFIER_VERSION
+
+    before = prediction_cache.content_digest(b"leaf")
+    monkeypatch.setattr(prediction_cache, "DIGEST_SALT", b"next")
+    assert prediction_cache.content_digest(b"leaf") != before
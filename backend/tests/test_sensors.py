@@ -0,0 +1,70 @@
+import math
+
+import pytest
+
+import db_handler
+from sensors import DeviceWindows, SensorStore
+
+
+def test_missing_metric_still_expires():
+    device = DeviceWindows()
+    device.push(0, (10.0, None, None))
+    device.push(1800, (20.0, None, None))
+    device.push(7200, (None, 55.0, None))
+
+    stats = device.stats()["1h"]
+    assert stats["temperature"] == {"count": 0, "min": None, "max": None, "mean": None}
+    assert stats["humidity"]["count"] == 1
+    assert device.stats()["24h"]["temperature"]["count"] == 2
+
+
+@pytest.mark.parametrize("bad", [math.nan, math.inf, -math.inf])
+def test_non_finite_values_are_skipped(bad):
+    device = DeviceWindows()
+    device.push(0, (bad, None, None))
+    for hour in range(1, 50):
+        device.push(hour * 3600, (20.0, None, None))
+
+    temperature = device.stats()["24h"]["temperature"]
+    assert temperature["mean"] == 20.0
+    assert temperature["count"] == 24
+
+
+def test_store_aggregates_ignore_nan(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_handler, "DB_PATH", str(tmp_path / "history.db"))
+    store = SensorStore()
+    store.ingest([("dev", 0, math.nan, 50.0, None), ("dev", 60, 21.0, 52.0, None)])
+
+    windows = store.aggregates("dev")["windows"]
+    assert windows["1h"]["temperature"]["mean"] == 21.0
+    assert windows["1h"]["humidity"]["count"] == 2
+
+
+def test_api_rejects_nan(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    monkeypatch.setattr(db_handler, "DB_PATH", str(tmp_path / "history.db"))
+    monkeypatch.setattr(main, "sensor_store", SensorStore())
+    body = '[{"device_id": "d", "timestamp": "2026-01-01T00:00:00", "temperature": NaN}]'
+    resp = TestClient(main.app).post("/api/sensors/readings", content=body,
+                                     headers={"content-type": "application/json"})
+    assert resp.status_code == 422
+
+
+def test_workers_and_restarts_agree(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_handler, "DB_PATH", str(tmp_path / "history.db"))
+    first, second = SensorStore(), SensorStore()  # two worker processes
+
+    first.ingest([("dev", 0, 20.0, None, None), ("dev", 600, 22.0, None, None)])
+    assert second.aggregates("dev")["windows"]["1h"]["temperature"]["count"] == 2
+
+    second.ingest([("dev", 1200, 24.0, None, None)])
+    # A late reading from a poor link, taken by the first worker
+    assert first.ingest([("dev", 300, 30.0, None, None)]) == (1, 1)
+
+    expected = SensorStore().aggregates("dev")  # as after a restart
+    assert expected["windows"]["1h"]["temperature"] == {"count": 4, "min": 20.0, "max": 30.0, "mean": 24.0}
+    assert first.aggregates("dev") == expected
+    assert second.aggregates("dev") == expected
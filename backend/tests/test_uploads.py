@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import uploads
+
+
+def test_large_file_parts_stay_in_memory(monkeypatch):
+    rolled = []
+    original = tempfile.SpooledTemporaryFile.rollover
+    monkeypatch.setattr(tempfile.SpooledTemporaryFile, "rollover",
+                        lambda self: rolled.append(1) or original(self))
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        form = await uploads.read_form(request, 8 * 1024 * 1024)
+        [file] = uploads.form_files(form, "file")
+        return {"name": uploads.form_text(form, "farmer_name"), "size": len(await file.read())}
+
+    client = TestClient(app)
+    photo = os.urandom(5 * 1024 * 1024)
+    resp = client.post("/upload", data={"farmer_name": "x"}, files={"file": ("leaf.jpg", photo, "image/jpeg")})
+    assert resp.json() == {"name": "x", "size": len(photo)}
+    assert not rolled
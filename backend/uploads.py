@@ -0,0 +1,112 @@
+"""
+uploads.py
+----------
+Reads multipart leaf uploads straight into memory.
+
+FastAPI's File()/Form() parameters are parsed by Starlette before the
+endpoint runs: every file part over 1 MiB is rolled out to a temporary file
+on disk, and no size limit applies. read_form() parses the same body from
+request.stream() instead, keeping file parts in memory and refusing a body
+larger than `limit` bytes - up front from Content-Length, and while
+streaming for chunked or mislabelled requests - before it is buffered.
+"""
+
+from fastapi import HTTPException
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+# Room for the multipart boundaries, part headers and the text fields
+FORM_OVERHEAD = 64 * 1024
+
+
+def _mib(n):
+    return f"{n // (1024 * 1024)} MiB"
+
+
+class InMemoryMultiPartParser(MultiPartParser):
+    """
+    Starlette's parser with the spool size raised so file parts never reach
+    disk, refusing any single file over max_file_bytes as it arrives.
+    """
+
+    def __init__(self, headers, stream, spool_size, max_files, max_file_bytes):
+        super().__init__(headers, stream, max_files=max_files, max_fields=16)
+        # Named max_file_size before Starlette 0.38
+        self.spool_max_size = self.max_file_size = spool_size
+        self.max_file_bytes = max_file_bytes
+        self._file_bytes = 0
+
+    def on_part_begin(self):
+        super().on_part_begin()
+        self._file_bytes = 0
+
+    def on_part_data(self, data, start, end):
+        if self._current_part.file is not None:
+            self._file_bytes += end - start
+            if self._file_bytes > self.max_file_bytes:
+                name = self._current_part.file.filename or "Image"
+                raise HTTPException(status_code=413, detail=f"{name} is larger than {_mib(self.max_file_bytes)}")
+        super().on_part_data(data, start, end)
+
+
+async def _limited(stream, limit):
+    total = 0
+    async for chunk in stream:
+        total += len(chunk)
+        if total > limit:
+            raise HTTPException(status_code=413, detail=f"Upload is larger than {_mib(limit)}")
+        yield chunk
+
+
+async def read_form(request, limit, max_files=1, max_file_bytes=None):
+    """
+    Parse a multipart/form-data request whose body is at most `limit` bytes
+    (plus FORM_OVERHEAD) into Starlette FormData held in memory. 413 for a
+    larger body or a file over max_file_bytes (default `limit`), 400 for
+    more than max_files files or a malformed body.
+    """
+    max_file_bytes = max_file_bytes or limit
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=415, detail="Expected a multipart/form-data upload")
+    limit += FORM_OVERHEAD
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise HTTPException(status_code=413, detail=f"Upload is larger than {_mib(limit)}")
+
+    parser = InMemoryMultiPartParser(request.headers, _limited(request.stream(), limit), limit,
+                                     max_files, max_file_bytes)
+    try:
+        return await parser.parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+
+def form_text(form, name, default=None):
+    """A text field of the form; 422 when a required one (default None) is missing."""
+    value = form.get(name, default)
+    if value is None or not isinstance(value, str):
+        raise HTTPException(status_code=422, detail=f"Form field '{name}' is required")
+    return value
+
+
+def form_files(form, name):
+    """The uploaded files under `name`, in upload order; 422 if there are none."""
+    files = [f for f in form.getlist(name) if not isinstance(f, str)]
+    if not files:
+        raise HTTPException(status_code=422, detail=f"Form field '{name}' must be a file upload")
+    return files
+
+
+def form_openapi(file_field, many=False):
+    """openapi_extra documenting the farmer_name/lang/file form these endpoints take."""
+    file_schema = {"type": "string", "format": "binary"}
+    if many:
+        file_schema = {"type": "array", "items": file_schema}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "required": ["farmer_name", file_field],
+        "properties": {
+            "farmer_name": {"type": "string"},
+            "lang": {"type": "string", "default": "en"},
+            file_field: file_schema,
+        },
+    }}}}}
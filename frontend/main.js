@@ -156,31 +156,44 @@ if (diseaseForm) {
 }
 
 // History Loading
-async function loadHistory() {
+let historyCursor = null;
+
+async function loadHistory(append = false) {
   const tbody = document.getElementById('history-tbody');
-  tbody.innerHTML = `<tr><td colspan="5" style="text-align:center;">Loading...</td></tr>`;
-  
+  const moreBtn = document.getElementById('more-history');
+  const lang = document.getElementById('disease-lang')?.value || 'en';
+  if (!append) {
+    historyCursor = null;
+    tbody.innerHTML = `<tr><td colspan="5" style="text-align:center;">Loading...</td></tr>`;
+  }
+
   try {
-    const res = await fetch(`${API_BASE}/history`);
+    const params = new URLSearchParams({ limit: 50, lang });
+    if (append && historyCursor) params.set('cursor', historyCursor);
+    const res = await fetch(`${API_BASE}/history?${params}`);
     const data = await res.json();
     
     if (data.success && data.history.length > 0) {
-      tbody.innerHTML = data.history.map(row => `
+      const rows = data.history.map(row => `
         <tr>
           <td>${row.timestamp ? new Date(row.timestamp).toLocaleDateString() : '-'}</td>
           <td>${row.farmer_name || '-'}</td>
           <td>${row.crop || '-'}</td>
           <td>${row.disease || '-'}</td>
-          <td>${row.remedy_en || '-'}</td>
+          <td>${row[`remedy_${lang}`] || '-'}</td>
         </tr>
       `).join('');
-    } else {
+      tbody.innerHTML = append ? tbody.innerHTML + rows : rows;
+    } else if (!append) {
       tbody.innerHTML = `<tr><td colspan="5" style="text-align:center;">No history found.</td></tr>`;
     }
+    historyCursor = data.next_cursor || null;
+    moreBtn?.classList.toggle('hidden', !historyCursor);
   } catch (err) {
     console.error(err);
     tbody.innerHTML = `<tr><td colspan="5" style="text-align:center; color:#ef4444;">Failed to load history.</td></tr>`;
   }
 }
 
-document.getElementById('refresh-history')?.addEventListener('click', loadHistory);
+document.getElementById('refresh-history')?.addEventListener('click', () => loadHistory());
+document.getElementById('more-history')?.addEventListener('click', () => loadHistory(true));